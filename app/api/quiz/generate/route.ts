@@ -16,16 +16,11 @@ async function extractTextFromNote(noteId: string, userId: string) {
     throw new Error("Note not found");
   }
 
-  // Call Python service for text extraction
-  const base64File = note.fileData.toString("base64");
-  
+  // Call Python service for text extraction, sending the raw file bytes
   const response = await fetch(`${PYTHON_SERVICE_URL}/extract`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({
-      file: base64File,
-      mimeType: note.fileType,
-    }),
+    headers: { "Content-Type": note.fileType },
+    body: note.fileData,
   });
 
   if (!response.ok) {
@@ -33,7 +28,7 @@ async function extractTextFromNote(noteId: string, userId: string) {
   }
 
   const data = await response.json();
-  return data.text;
+  return { text: data.text as string, pageOffsets: data.pageOffsets as number[] | undefined };
 }
 
 async function getFlashcardContent(deckId: string, userId: string) {
@@ -55,7 +50,9 @@ async function generateQuizWithRAG(
   topic: string,
   questionCount: number,
   difficulty: string,
-  questionTypes: string[]
+  questionTypes: string[],
+  documentId?: string,
+  pageOffsets?: number[]
 ) {
   // Call Python service for RAG-based quiz generation
   const response = await fetch(`${PYTHON_SERVICE_URL}/generate-quiz`, {
@@ -67,6 +64,9 @@ async function generateQuizWithRAG(
       questionCount,
       difficulty,
       questionTypes,
+      // Lets the service re-embed only the chunks that changed since this document was last indexed
+      documentId,
+      pageOffsets,
     }),
   });
 
@@ -98,10 +98,13 @@ export async function POST(req: NextRequest) {
     let content = "";
     let actualSourceType: "note" | "flashcard" | "ai-generated" = "ai-generated";
     let actualSourceId = undefined;
+    let pageOffsets: number[] | undefined = undefined;
 
     // Get content based on source
     if (sourceType === "note" && sourceId) {
-      content = await extractTextFromNote(sourceId, user.userId);
+      const extracted = await extractTextFromNote(sourceId, user.userId);
+      content = extracted.text;
+      pageOffsets = extracted.pageOffsets;
       actualSourceType = "note";
       actualSourceId = sourceId;
     } else if (sourceType === "flashcard" && sourceId) {
@@ -119,7 +122,9 @@ export async function POST(req: NextRequest) {
       topic,
       questionCount,
       difficulty,
-      questionTypes
+      questionTypes,
+      actualSourceId ? `${actualSourceType}:${actualSourceId}` : undefined,
+      pageOffsets
     );
 
     // Save quiz to database
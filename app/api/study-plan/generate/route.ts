@@ -40,19 +40,13 @@ export async function POST(req: NextRequest) {
     const notesContent = await Promise.all(
       notes.map(async (note) => {
         try {
-          // Convert Buffer to base64 string
-          const base64Data = note.fileData.toString('base64');
-          
-          // Call Python extraction service
+          // Call Python extraction service with the raw file bytes
           const extractResponse = await fetch(`${PYTHON_SERVICE_URL}/extract`, {
             method: 'POST',
             headers: {
-              'Content-Type': 'application/json',
+              'Content-Type': note.fileType,
             },
-            body: JSON.stringify({
-              file: base64Data,
-              mimeType: note.fileType,
-            }),
+            body: note.fileData,
           });
 
           if (!extractResponse.ok) {
@@ -0,0 +1,94 @@
+"""Deterministic fixture documents for the benchmarks.
+
+Everything is generated from a fixed seed, so runs on different machines
+and commits extract, chunk and embed exactly the same content.
+"""
+import io
+import random
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS = (
+    "cell membrane protein enzyme energy glucose oxygen carbon dioxide chlorophyll light reaction "
+    "mitochondria nucleus gene DNA RNA replication transcription translation ribosome amino acid "
+    "equation force mass acceleration velocity momentum gravity friction wave frequency amplitude "
+    "reaction catalyst molecule atom electron bond covalent ionic solution acid base equilibrium "
+    "history revolution empire treaty economy trade policy society culture population migration"
+).split()
+
+
+def note_text(sentences, seed=0):
+    """Study-note style prose: numbered headings followed by pseudo-random sentences"""
+    rng = random.Random(seed)
+    paragraphs = []
+    for index in range(0, sentences, 8):
+        lines = [f"{index // 8 + 1}. {rng.choice(WORDS).title()} and {rng.choice(WORDS)}"]
+        for _ in range(min(8, sentences - index)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+            lines.append(" ".join(words).capitalize() + ".")
+        paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs)
+
+
+def text_page(doc, text, font_size=10):
+    """Add a page with a text layer, dropping trailing lines that do not fit at font_size"""
+    page = doc.new_page()
+    lines = text.split("\n")
+    # insert_textbox writes nothing and returns a negative number when the text overflows
+    while (spare := page.insert_textbox(fitz.Rect(50, 50, 545, 792), "\n".join(lines), fontsize=font_size)) < 0:
+        lines.pop()
+    assert spare >= 0 and (lines or not text)
+    return page
+
+
+def scanned_page(doc, text, font_size=10, dpi=200):
+    """Add a page that is only an image of text, like a scanner produces"""
+    source = fitz.open()
+    text_page(source, text, font_size)
+    pix = source[0].get_pixmap(dpi=dpi)
+    page = doc.new_page()
+    page.insert_image(page.rect, stream=pix.tobytes('png'))
+    return page
+
+
+def text_pdf(pages, seed=0):
+    """A PDF with a real text layer on every page"""
+    doc = fitz.open()
+    for page in range(pages):
+        text_page(doc, note_text(24, seed + page))
+    return doc.tobytes()
+
+
+def scanned_pdf(pages, seed=0, font_sizes=(10,), blank_pages=0):
+    """A PDF of scanned pages, cycling through font_sizes, followed by blank scans"""
+    doc = fitz.open()
+    for page in range(pages):
+        scanned_page(doc, note_text(16, seed + page), font_sizes[page % len(font_sizes)])
+    for _ in range(blank_pages):
+        scanned_page(doc, '')
+    return doc.tobytes()
+
+
+def mixed_pdf(pages, seed=0):
+    """Alternating text-layer and scanned pages"""
+    doc = fitz.open()
+    for page in range(pages):
+        if page % 2 == 0:
+            text_page(doc, note_text(24, seed + page))
+        else:
+            scanned_page(doc, note_text(16, seed + page))
+    return doc.tobytes()
+
+
+def photo(width, height, font_size, seed=0):
+    """A JPEG of dark text on an off-white background, like a phone photo of notes"""
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), (236, 232, 224))
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=font_size)
+    for y in range(font_size * 2, height - font_size * 2, int(font_size * 1.6)):
+        draw.text((font_size * 2, y), " ".join(rng.choice(WORDS) for _ in range(6)), fill=(30, 30, 40), font=font)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
@@ -0,0 +1,99 @@
+"""Compare the fixed 300 DPI OCR pipeline with adaptive preprocessing.
+
+Builds a small fixture corpus in memory (scanned PDF pages at several text
+sizes, blank scanned pages and phone-camera sized photos) and OCRs it twice:
+once the way ocr-service used to (PNG at OCR_DPI, images upscaled 2x) and
+once through the current ocr-service functions. Reports pages/sec and mean
+Tesseract confidence for each. Requires the tesseract binary.
+
+    python benchmarks/ocr_preprocessing.py [--json]
+"""
+import io
+import json
+import os
+import sys
+import time
+
+# Measure OCR work, not cache hits, and keep both pipelines single-process
+os.environ['EXTRACTION_CACHE_MAX_BYTES'] = '0'
+os.environ['OCR_WORKERS'] = '1'
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'ocr-service')]
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+import ocr_service
+from fixtures import photo, scanned_pdf
+
+config = ocr_service.extractor.config
+
+
+def baseline_ocr(img):
+    ocr_data = pytesseract.image_to_data(img, lang=config.lang, output_type=pytesseract.Output.DICT)
+    confidences = [int(conf) for conf in ocr_data['conf'] if conf != '-1']
+    return sum(confidences) / len(confidences) if confidences else 0
+
+
+def baseline_pdf(pdf_bytes):
+    doc = fitz.open(stream=pdf_bytes, filetype='pdf')
+    confidences = []
+    for page in doc:
+        pix = page.get_pixmap(matrix=fitz.Matrix(config.dpi/72, config.dpi/72))
+        confidences.append(baseline_ocr(Image.open(io.BytesIO(pix.tobytes('png')))))
+    return confidences
+
+
+def baseline_image(image_bytes):
+    img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+    img = img.resize((img.width * 2, img.height * 2), Image.LANCZOS)
+    return [baseline_ocr(img)]
+
+
+def adaptive_pdf(pdf_bytes):
+    return [page.confidence for page in ocr_service.extractor.iter_pdf_pages(pdf_bytes)]
+
+
+def adaptive_image(image_bytes):
+    return [ocr_service.extractor.extract_image(image_bytes)['confidence']]
+
+
+def run(name, pdf_runner, image_runner, corpus):
+    started = time.perf_counter()
+    confidences = []
+    for kind, data in corpus:
+        runner = pdf_runner if kind == 'pdf' else image_runner
+        confidences.extend(runner(data))
+    elapsed = time.perf_counter() - started
+    # Blank pages carry no text, so they are left out of the confidence average
+    text_confidences = [confidence for confidence in confidences if confidence > 0]
+    return {
+        'pipeline': name,
+        'pages': len(confidences),
+        'seconds': round(elapsed, 2),
+        'pagesPerSecond': round(len(confidences) / elapsed, 2),
+        'meanConfidence': round(sum(text_confidences) / len(text_confidences), 2) if text_confidences else 0
+    }
+
+
+def main():
+    corpus = [
+        ('pdf', scanned_pdf(5, font_sizes=(8, 10, 12, 16, 24), blank_pages=2)),
+        ('image', photo(3024, 4032, 72)),
+        ('image', photo(1200, 900, 18)),
+    ]
+    results = [
+        run('fixed', baseline_pdf, baseline_image, corpus),
+        run('adaptive', adaptive_pdf, adaptive_image, corpus),
+    ]
+    if '--json' in sys.argv:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print(f"{result['pipeline']:>9}: {result['pages']} pages in {result['seconds']}s "
+              f"({result['pagesPerSecond']} pages/s), mean confidence {result['meanConfidence']}")
+
+
+if __name__ == '__main__':
+    main()
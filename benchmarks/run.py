@@ -0,0 +1,375 @@
+"""Offline benchmark suite for the extraction, indexing and quiz paths.
+
+Every case runs in a fresh interpreter so its peak RSS is its own, against
+fixtures generated from a fixed seed (benchmarks/fixtures.py) and, for the
+quiz, a local stub LLM (benchmarks/stub_llm.py). Caches are disabled so each
+repeat measures the full work. Results are printed and can be written as
+JSON and compared with an earlier run:
+
+    python benchmarks/run.py --output baseline.json
+    python benchmarks/run.py --compare baseline.json
+
+--fake-embeddings swaps the sentence-transformers model for a deterministic
+fake, for machines without the model downloaded; chunks/sec then measures
+splitting and FAISS only. --embedding-backend onnx runs the indexing and quiz
+cases on the ONNX model instead, and the embedding case compares the two
+backends' speed and nearest-neighbour recall. OCR cases are skipped without
+the tesseract binary, the embedding case without an exported ONNX model.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# Case name -> (suite, what it needs beyond the requirements: None, 'tesseract' or 'onnx')
+CASES = {
+    'extract_text_pdf': ('extraction', None),
+    'extract_scanned_pdf': ('extraction', 'tesseract'),
+    'extract_mixed_pdf': ('extraction', 'tesseract'),
+    'extract_images': ('extraction', 'tesseract'),
+    'create_vector_store': ('indexing', None),
+    'reindex_edited_note': ('indexing', None),
+    'embedding_backends': ('embedding', 'onnx'),
+    'generate_quiz_5': ('quiz', None),
+    'generate_quiz_25': ('quiz', None),
+}
+
+# Metric each case is compared on, and whether higher is better
+PRIMARY_METRICS = {
+    'extraction': ('pagesPerSecond', True),
+    'indexing': ('chunksPerSecond', True),
+    'embedding': ('chunksPerSecond', True),
+    'quiz': ('p50Seconds', False),
+}
+
+PDF_PAGES = 8
+INDEX_SENTENCES = 1200
+QUIZ_SENTENCES = 400
+EMBEDDING_QUERIES = 50
+RECALL_K = 10
+
+# Same default as python-service/app.py
+ONNX_MODEL_PATH = os.environ.get('EMBEDDING_ONNX_PATH', os.path.join(
+    REPO_DIR, 'python-service', 'models', 'all-MiniLM-L6-v2-onnx', 'model_int8.onnx'
+))
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children (OCR workers), in MB"""
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    return round(max(self_kb, children_kb) / scale, 1)
+
+
+def timings(seconds):
+    return {
+        'meanSeconds': round(statistics.mean(seconds), 4),
+        'p50Seconds': round(statistics.median(seconds), 4),
+        'maxSeconds': round(max(seconds), 4),
+    }
+
+
+def import_ocr_service():
+    os.environ['EXTRACTION_CACHE_MAX_BYTES'] = '0'
+    sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'ocr-service')]
+    import ocr_service
+    return ocr_service
+
+
+def import_python_service(args):
+    os.environ.update({
+        'MODEL_LOADING': 'background',
+        'INDEX_CACHE_MAX_BYTES': '0',
+        'INDEX_MEMORY_MAX_BYTES': '0',
+        'EMBEDDING_CACHE_MAX_ROWS': '0',
+        'LLM_CACHE_MAX_BYTES': '0',
+        'JOB_DB_PATH': os.path.join(tempfile.mkdtemp(prefix='study-buddy-bench-'), 'jobs.sqlite3'),
+        'EMBEDDING_BACKEND': args.embedding_backend,
+    })
+    os.environ.setdefault('GROQ_API_KEY', 'benchmark')
+    sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'python-service')]
+    import app
+    if args.fake_embeddings:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+        app._model_embeddings = DeterministicFakeEmbedding(size=384)
+    app.get_model_embeddings()
+    return app
+
+
+def measure(fn, warm_up, inputs):
+    """Time fn over each input after one untimed call on warm_up, which pays for lazy imports"""
+    fn(warm_up)
+    seconds, outputs = [], []
+    for data in inputs:
+        started = time.perf_counter()
+        outputs.append(fn(data))
+        seconds.append(time.perf_counter() - started)
+    return seconds, outputs
+
+
+def run_extraction(case, args):
+    import fixtures
+    ocr_service = import_ocr_service()
+    if case == 'extract_images':
+        inputs = [[fixtures.photo(1600, 1200, 24, seed=seed), fixtures.photo(3024, 4032, 64, seed=seed)]
+                  for seed in range(args.repeat + 1)]
+        extract = lambda images: sum(ocr_service.extractor.extract_image(image)['pages'] for image in images)
+    else:
+        make = {
+            'extract_text_pdf': fixtures.text_pdf,
+            'extract_scanned_pdf': fixtures.scanned_pdf,
+            'extract_mixed_pdf': fixtures.mixed_pdf,
+        }[case]
+        inputs = [make(PDF_PAGES, seed=seed) for seed in range(args.repeat + 1)]
+        extract = lambda pdf: ocr_service.extractor.extract_pdf(pdf)['pages']
+
+    # Every repeat and the warm-up get their own seed, so nothing is served from a cache
+    seconds, pages = measure(extract, inputs[-1], inputs[:-1])
+    pages = sum(pages)
+    # Reap the OCR workers so their peak RSS shows up in RUSAGE_CHILDREN
+    if ocr_service.extractor.pool is not None:
+        ocr_service.extractor.pool.shutdown()
+    return {'pages': pages, 'pagesPerSecond': round(pages / sum(seconds), 2), **timings(seconds)}
+
+
+def run_indexing(case, args):
+    import fixtures
+    app = import_python_service(args)
+    texts = [fixtures.note_text(INDEX_SENTENCES, seed=seed) for seed in range(args.repeat + 1)]
+    if case == 'reindex_edited_note':
+        # Index each note untimed, then time re-indexing it after one paragraph was edited.
+        # Previous versions stay loaded, as in a serving worker, so their vectors can be reused
+        app.vector_store_cache.memory_max_bytes = 256 * 1024 * 1024
+        inputs = []
+        for seed, text in enumerate(texts):
+            app.create_vector_store(text, f"bench:{seed}")
+            paragraphs = text.split('\n\n')
+            paragraphs[len(paragraphs) // 2] += ' This sentence was added in an edit.'
+            inputs.append((f"bench:{seed}", '\n\n'.join(paragraphs)))
+        build = lambda item: app.create_vector_store(item[1], item[0]).index.ntotal
+    else:
+        inputs = texts
+        build = lambda text: app.create_vector_store(text).index.ntotal
+
+    embedded = app.vector_store_cache.counters['embeddedChunks']
+    seconds, chunks = measure(build, inputs[-1], inputs[:-1])
+    chunks = sum(chunks)
+    return {
+        'chunks': chunks, 'chunksPerSecond': round(chunks / sum(seconds), 2),
+        'embeddedChunks': app.vector_store_cache.counters['embeddedChunks'] - embedded, **timings(seconds)
+    }
+
+
+def run_embedding(case, args):
+    """Embed one note's chunks with both backends: chunks/sec of each, and how many of the
+    torch model's nearest neighbours the ONNX model finds for sentences used as queries"""
+    import fixtures
+    import numpy as np
+    args.embedding_backend = 'torch'
+    app = import_python_service(args)
+    text = fixtures.note_text(INDEX_SENTENCES, seed=0)
+    chunks = [chunk.page_content for chunk in app.iter_chunks(text)]
+    queries = [sentence for sentence in text.split('. ') if sentence][:EMBEDDING_QUERIES]
+    backends = {
+        'torch': app.get_model_embeddings(),
+        'onnx': app.OnnxEmbeddings(ONNX_MODEL_PATH, app.EMBED_BATCH_SIZE, app.EMBED_TORCH_THREADS),
+    }
+
+    results, neighbours = {}, {}
+    for name, embeddings in backends.items():
+        seconds, vectors = measure(embeddings.embed_documents, chunks[:app.EMBED_BATCH_SIZE], [chunks] * args.repeat)
+        results[name] = (seconds, round(len(chunks) * args.repeat / sum(seconds), 2))
+        scores = np.asarray(embeddings.embed_documents(queries)) @ np.asarray(vectors[0]).T
+        neighbours[name] = np.argsort(-scores, axis=1)[:, :RECALL_K]
+
+    recall = np.mean([
+        len(set(expected) & set(found)) / RECALL_K for expected, found in zip(neighbours['torch'], neighbours['onnx'])
+    ])
+    seconds, chunks_per_second = results['onnx']
+    return {
+        'chunks': len(chunks),
+        'chunksPerSecond': chunks_per_second,
+        'torchChunksPerSecond': results['torch'][1],
+        'speedup': round(chunks_per_second / results['torch'][1], 2),
+        'recallAt10': round(float(recall), 3),
+        'onnxModelMb': round(os.path.getsize(ONNX_MODEL_PATH) / 1024 / 1024, 1),
+        **timings(seconds)
+    }
+
+
+def run_quiz(case, args):
+    import fixtures
+    import stub_llm
+    os.environ['LLM_BASE_URL'], _ = stub_llm.start(latency_ms=args.llm_latency_ms)
+    app = import_python_service(args)
+    client = app.app.test_client()
+    question_count = int(case.rsplit('_', 1)[1])
+
+    def generate(seed):
+        response = client.post('/generate-quiz', json={
+            'content': fixtures.note_text(QUIZ_SENTENCES, seed=seed),
+            'topic': 'Biology',
+            'questionCount': question_count,
+            'cache': False,
+        })
+        questions = (response.get_json() or {}).get('questions', [])
+        if response.status_code != 200 or len(questions) < question_count:
+            raise RuntimeError(f"/generate-quiz answered {response.status_code} with {len(questions)} questions")
+        return int(response.headers.get('X-LLM-Prompt-Tokens', 0))
+
+    seconds, prompt_tokens = measure(generate, args.repeat, range(args.repeat))
+    return {
+        'questions': question_count,
+        'llmLatencyMs': args.llm_latency_ms,
+        'promptTokens': round(statistics.mean(prompt_tokens)),
+        **timings(seconds)
+    }
+
+
+def run_child(case, args):
+    """Run one case in this process and print its result as JSON"""
+    sys.path.insert(0, BENCHMARKS_DIR)
+    suite, _ = CASES[case]
+    runner = {'extraction': run_extraction, 'indexing': run_indexing, 'embedding': run_embedding, 'quiz': run_quiz}[suite]
+    result = runner(case, args)
+    print(json.dumps({'case': case, 'suite': suite, **result, 'peakRssMb': peak_rss_mb()}))
+
+
+def run_case(case, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', case,
+               '--repeat', str(args.repeat), '--llm-latency-ms', str(args.llm_latency_ms),
+               '--embedding-backend', args.embedding_backend]
+    if args.fake_embeddings:
+        command.append('--fake-embeddings')
+    completed = subprocess.run(command, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ['no output'])[-1]
+        return {'case': case, 'suite': CASES[case][0], 'error': error}
+    return json.loads(lines[-1])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def describe(result):
+    if 'error' in result:
+        return f"error: {result['error']}"
+    if 'skipped' in result:
+        return f"skipped: {result['skipped']}"
+    if result['suite'] == 'extraction':
+        head = f"{result['pagesPerSecond']} pages/s"
+    elif result['suite'] == 'indexing':
+        head = f"{result['chunksPerSecond']} chunks/s"
+    elif result['suite'] == 'embedding':
+        head = (f"onnx {result['chunksPerSecond']} chunks/s vs torch {result['torchChunksPerSecond']} "
+                f"({result['speedup']}x), recall@10 {result['recallAt10']}")
+    else:
+        head = f"p50 {result['p50Seconds']}s, max {result['maxSeconds']}s, {result.get('promptTokens', '?')} prompt tokens"
+    return f"{head}, mean {result['meanSeconds']}s, peak RSS {result['peakRssMb']} MB"
+
+
+def compare(results, baseline_path, threshold):
+    """Print the change in each case's primary metric; return True if any regressed past threshold"""
+    with open(baseline_path) as f:
+        baseline = {result['case']: result for result in json.load(f)['results']}
+
+    regressed = False
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(result['case'])
+        metric, higher_is_better = PRIMARY_METRICS[result['suite']]
+        if not before or metric not in before or metric not in result:
+            continue
+        change = (result[metric] - before[metric]) / before[metric] if before[metric] else 0
+        worse = -change if higher_is_better else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {result['case']:<22} {metric} {before[metric]} -> {result[metric]} ({change:+.1%}){flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Study Buddy's Python services")
+    parser.add_argument('--suite', default='extraction,indexing,embedding,quiz',
+                        help="comma-separated suites to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case (default: 3)")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--compare', help="compare with results from an earlier --output")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative slowdown reported as a regression (default: 0.1)")
+    parser.add_argument('--fake-embeddings', action='store_true',
+                        help="use a deterministic fake instead of the sentence-transformers model")
+    parser.add_argument('--embedding-backend', choices=['torch', 'onnx'], default='torch',
+                        help="embedding backend for the indexing and quiz cases (default: torch)")
+    parser.add_argument('--llm-latency-ms', type=int, default=300, help="stub LLM response time (default: 300)")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args)
+        return
+
+    suites = set(args.suite.split(','))
+    missing = {}
+    if shutil.which('tesseract') is None:
+        missing['tesseract'] = 'tesseract not installed'
+    if args.fake_embeddings:
+        missing['onnx'] = 'needs the real embedding model'
+    elif not os.path.exists(ONNX_MODEL_PATH):
+        missing['onnx'] = 'no ONNX model, run python-service/export_onnx_model.py'
+    results = []
+    for case, (suite, needs) in CASES.items():
+        if suite not in suites:
+            continue
+        if needs in missing:
+            result = {'case': case, 'suite': suite, 'skipped': missing[needs]}
+        else:
+            result = run_case(case, args)
+        print(f"{case:<22} {describe(result)}", flush=True)
+        results.append(result)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': args.repeat,
+            'fakeEmbeddings': args.fake_embeddings,
+            'embeddingBackend': args.embedding_backend,
+            'llmLatencyMs': args.llm_latency_ms,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    regressed = compare(results, args.compare, args.threshold) if args.compare else False
+    if regressed or any('error' in result for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""A local stand-in for the OpenAI-compatible chat completions API.
+
+Answers every POST to /chat/completions with a quiz in the JSON format the
+quiz prompt asks for, sized by the "Generate N" in the prompt, after a fixed
+delay that stands in for model latency. Streaming requests get the same
+answer as server-sent events. Point python-service's LLM_BASE_URL at it to
+time /generate-quiz without a network connection or an API key.
+
+    python benchmarks/stub_llm.py [--port 8100] [--latency-ms 300]
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_CHUNK_CHARS = 16
+
+
+def quiz_answer(prompt):
+    match = re.search(r'Generate (\d+)', prompt.split('Question:')[-1])
+    count = int(match.group(1)) if match else 5
+    # Batches of a large quiz get distinct prompts, so they get distinct questions
+    prefix = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+    questions = [{
+        "question": f"Which statement about {prefix} item {index + 1} is correct?",
+        "type": "mcq",
+        "options": ["Option A", "Option B", "Option C", "Option D"],
+        "correctAnswer": "Option A"
+    } for index in range(count)]
+    return json.dumps({"questions": questions}, indent=2)
+
+
+def make_handler(latency_seconds, first_token_seconds):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            content = quiz_answer(body['messages'][-1]['content'])
+            if body.get('stream'):
+                self.send_stream(content)
+            else:
+                time.sleep(latency_seconds)
+                self.send_json({"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+        def send_json(self, payload):
+            out = json.dumps(payload).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def send_stream(self, content):
+            # The total time matches a non-streamed answer; the first token
+            # arrives after first_token_seconds and the rest is spread evenly
+            chunks = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            gap = max(latency_seconds - first_token_seconds, 0) / max(len(chunks), 1)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            time.sleep(first_token_seconds)
+            for chunk in chunks:
+                event = {"choices": [{"delta": {"content": chunk}}]}
+                self.wfile.write(b"data: " + json.dumps(event).encode('utf-8') + b"\n\n")
+                self.wfile.flush()
+                time.sleep(gap)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return Handler
+
+
+def start(port=0, latency_ms=300, first_token_ms=50):
+    """Serve in a daemon thread and return the base URL to use as LLM_BASE_URL"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(latency_ms / 1000, first_token_ms / 1000))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--latency-ms', type=int, default=300)
+    parser.add_argument('--first-token-ms', type=int, default=50)
+    args = parser.parse_args()
+    url, server = start(args.port, args.latency_ms, args.first_token_ms)
+    print(f"Stub LLM listening on {url} (LLM_BASE_URL={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
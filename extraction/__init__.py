@@ -0,0 +1,22 @@
+"""Text extraction engine and background jobs shared by ocr-service and python-service.
+
+Both services build one Extractor from ExtractionConfig.from_env() and a
+JobQueue, and register the blueprints from make_extract_blueprint,
+make_jobs_blueprint and make_metrics_blueprint, so the /extract, /jobs and
+/metrics routes and the text-layer/OCR decision, preprocessing and caching
+behind them are the same in both. The repository root must be on
+PYTHONPATH (the Docker images copy this package next to the service).
+"""
+from .cache import ExtractionCache
+from .config import ExtractionConfig
+from .engine import Extractor, PageResult, summarize_pages
+from .jobs import JobQueue, job_accepted, make_jobs_blueprint, wants_async
+from .metrics import log_error, make_metrics_blueprint, record_stage, timed
+from .routes import make_extract_blueprint
+from .uploads import read_batch_upload, read_upload, remove_temp_file
+
+__all__ = [
+    'ExtractionCache', 'ExtractionConfig', 'Extractor', 'JobQueue', 'PageResult', 'job_accepted', 'log_error',
+    'make_extract_blueprint', 'make_jobs_blueprint', 'make_metrics_blueprint', 'read_batch_upload', 'read_upload',
+    'record_stage', 'remove_temp_file', 'summarize_pages', 'timed', 'wants_async'
+]
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+
+from .metrics import CACHE_REQUESTS
+
+# Eviction trims the cache to this fraction of its budget, so the directory is
+# scanned once per tenth of the budget written rather than on every write
+EVICT_TO_FRACTION = 0.9
+
+
+class ExtractionCache:
+    """Size-bounded on-disk LRU cache of extraction results, keyed by content hash.
+
+    Entries are small JSON files whose modification time records the last
+    use, so eviction stays correct when several gunicorn workers share the
+    same directory. Each worker keeps a running total of the directory size,
+    measured by a scan and then advanced by its own writes, and only scans
+    and evicts again once that total passes the budget; writes by other
+    workers are picked up by the next scan. Hit/miss counters are kept per worker and per kind
+    ('document' for whole files, 'page' for individually OCR'd PDF pages).
+    """
+    
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.counters = {}
+        # Estimated bytes on disk; None until the first write scans the directory
+        self.total_bytes = None
+    
+    def get(self, kind, key):
+        """Return the cached value for key, or None on a miss"""
+        if self.max_bytes <= 0:
+            return None
+        
+        path = os.path.join(self.cache_dir, key + '.json')
+        try:
+            with open(path, 'r') as cache_file:
+                value = json.load(cache_file)
+            os.utime(path)  # Mark as most recently used
+        except (OSError, ValueError):
+            value = None
+        
+        self._count(kind, 'misses' if value is None else 'hits')
+        return value
+    
+    def put(self, key, value):
+        """Store value under key, evicting least recently used entries when over budget"""
+        if self.max_bytes <= 0:
+            return
+        
+        data = json.dumps(value).encode('utf-8')
+        path = os.path.join(self.cache_dir, key + '.json')
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if self.total_bytes is None:
+                self.total_bytes = sum(size for _, size, _ in self._entries())
+            try:
+                replaced_bytes = os.stat(path).st_size
+            except OSError:
+                replaced_bytes = 0
+            # Write then rename so readers never see a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(data)
+            os.replace(temp_path, path)
+            self.total_bytes += len(data) - replaced_bytes
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+    
+    def stats(self):
+        """Return hit/miss counters and current disk usage"""
+        entries = self._entries()
+        with self.lock:
+            counters = {kind: dict(counts) for kind, counts in self.counters.items()}
+        return {
+            'enabled': self.max_bytes > 0,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'maxBytes': self.max_bytes,
+            **counters
+        }
+    
+    def _count(self, kind, outcome):
+        with self.lock:
+            counts = self.counters.setdefault(kind, {'hits': 0, 'misses': 0})
+            counts[outcome] += 1
+        CACHE_REQUESTS.labels(f"extraction_{kind}", 'hit' if outcome == 'hits' else 'miss').inc()
+    
+    def _entries(self):
+        entries = []
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+    
+    def _evict(self):
+        """Rescan the directory and remove least recently used entries down to EVICT_TO_FRACTION of the budget"""
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        if total_bytes > self.max_bytes:
+            target_bytes = self.max_bytes * EVICT_TO_FRACTION
+            for _, size, path in entries:
+                if total_bytes <= target_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total_bytes -= size
+        self.total_bytes = total_bytes
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from dataclasses import dataclass
+
+
+def env_flag(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+
+def default_ocr_workers():
+    """The CPUs shared out between gunicorn workers (WEB_CONCURRENCY), so their OCR pools don't oversubscribe them"""
+    return max((os.cpu_count() or 1) // int(os.environ.get('WEB_CONCURRENCY', 1)), 1)
+
+
+@dataclass(frozen=True)
+class ExtractionConfig:
+    """Tunables for the extraction engine.
+
+    Every setting that changes extraction output is also part of the
+    extraction cache key. The config is passed to OCR pool processes, so
+    it must stay picklable.
+    """
+
+    # Highest and lowest render resolution for scanned PDF pages
+    dpi: int = 300
+    min_dpi: int = 150
+    # Scanned pages are probed at this resolution, skipped when blank, and
+    # rendered (images rescaled) so text lines come out about
+    # target_text_height pixels tall. A page is blank when less than
+    # blank_ink_ratio of it is ink: pixels at least blank_contrast grey
+    # levels darker (or lighter) than the paper
+    probe_dpi: int = 96
+    target_text_height: int = 40
+    blank_ink_ratio: float = 0.001
+    blank_contrast: int = 24
+    binarize: bool = True
+    # Tesseract language(s), e.g. eng or eng+deu
+    lang: str = 'eng'
+    # Pages whose text layer has fewer characters than this are OCR'd
+    min_text_chars: int = 50
+    # Processes used to OCR scanned pages; 1 keeps OCR in-process
+    workers: int = 1
+    # Guards against pathological uploads; pages they stop are returned as
+    # skipped, and results with skipped pages are not cached. Seconds
+    # Tesseract may spend on one page or image frame, pages read per
+    # document, pixels in one page render or decoded image frame (renders are
+    # scaled down to fit), and seconds one extraction may take. 0 means no limit
+    page_timeout: float = 60
+    max_pages: int = 1000
+    max_pixels: int = 64_000_000
+    deadline: float = 300
+    # On-disk extraction result cache; a size of 0 disables it
+    cache_dir: str = os.path.join(tempfile.gettempdir(), 'study-buddy-extraction-cache')
+    cache_max_bytes: int = 512 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls):
+        """Build a config from the OCR_* and EXTRACTION_* environment variables"""
+        defaults = cls()
+        return cls(
+            dpi=int(os.environ.get('OCR_DPI', defaults.dpi)),
+            min_dpi=int(os.environ.get('OCR_MIN_DPI', defaults.min_dpi)),
+            target_text_height=int(os.environ.get('OCR_TARGET_TEXT_HEIGHT', defaults.target_text_height)),
+            blank_ink_ratio=float(os.environ.get('OCR_BLANK_INK_RATIO', defaults.blank_ink_ratio)),
+            blank_contrast=int(os.environ.get('OCR_BLANK_CONTRAST', defaults.blank_contrast)),
+            binarize=env_flag('OCR_BINARIZE', 'true'),
+            lang=os.environ.get('OCR_LANG', defaults.lang),
+            min_text_chars=int(os.environ.get('OCR_MIN_TEXT_CHARS', defaults.min_text_chars)),
+            workers=int(os.environ.get('OCR_WORKERS', default_ocr_workers())),
+            page_timeout=float(os.environ.get('OCR_PAGE_TIMEOUT_SECONDS', defaults.page_timeout)),
+            max_pages=int(os.environ.get('EXTRACTION_MAX_PAGES', defaults.max_pages)),
+            max_pixels=int(os.environ.get('EXTRACTION_MAX_PIXELS', defaults.max_pixels)),
+            deadline=float(os.environ.get('EXTRACTION_DEADLINE_SECONDS', defaults.deadline)),
+            cache_dir=os.environ.get('EXTRACTION_CACHE_DIR', defaults.cache_dir),
+            cache_max_bytes=int(os.environ.get('EXTRACTION_CACHE_MAX_BYTES', defaults.cache_max_bytes))
+        )
+
+    def cache_tag(self):
+        """The settings that change extraction output, as a prefix for cache keys"""
+        return (
+            f"dpi={self.min_dpi}-{self.dpi}:lang={self.lang}:text={self.target_text_height}:"
+            f"blank={self.blank_ink_ratio}/{self.blank_contrast}:binarize={self.binarize}:min_chars={self.min_text_chars}:"
+            f"max_pixels={self.max_pixels}"
+        )
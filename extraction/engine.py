@@ -0,0 +1,375 @@
+import hashlib
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import asdict, dataclass, replace
+
+from .cache import ExtractionCache
+from .imaging import (
+    PageSkipped, analyze_page_image, choose_render_dpi, image_frame_count, max_render_dpi, ocr_image_frame,
+    ocr_page_image, open_pdf, pixmap_image, render_page
+)
+from .metrics import PAGES_EXTRACTED, record_stage, timed
+from .uploads import UPLOAD_CHUNK_SIZE
+
+# Confidence reported for pages read from the PDF text layer
+TEXT_LAYER_CONFIDENCE = 95
+
+
+@dataclass
+class PageResult:
+    """Text extracted from one PDF page or image frame.
+
+    index is 0-based. method is how the text was obtained: 'text_layer',
+    'ocr', 'cached' (OCR'd before, keyed by rendered pixels) or 'blank', or
+    'skipped' when an extraction guard stopped the page, with the reason.
+    """
+
+    index: int
+    text: str
+    confidence: float
+    method: str
+    reason: str = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def run_timed(fn, *args):
+    """Run fn(*args) and return (result, seconds), timing work done in a pool process"""
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+def ocr_result(page_result, deadline=None):
+    """Unwrap a result from Extractor.submit_ocr, recording how long the pool spent on it.
+
+    Raises PageSkipped when the page was skipped, or when it is still
+    being OCR'd at the deadline (a time.monotonic() value).
+    """
+    if isinstance(page_result, PageSkipped):
+        raise page_result
+    if isinstance(page_result, Future):
+        try:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            page_result, seconds = page_result.result(timeout=timeout)
+        except FutureTimeoutError:
+            page_result.cancel()
+            raise PageSkipped('deadline')
+        record_stage('ocr', seconds)
+    return page_result
+
+
+def cached_pages(result):
+    """Split a cached summarize_pages result back into PageResults, each with the result's confidence"""
+    text = result['text']
+    starts = result['pageOffsets']
+    ends = [start - 2 for start in starts[1:]] + [len(text)]
+    return [
+        PageResult(index, text[start:end], result['confidence'], 'cached')
+        for index, (start, end) in enumerate(zip(starts, ends))
+    ]
+
+
+def skipped_page(index, reason):
+    PAGES_EXTRACTED.labels('skipped').inc()
+    return PageResult(index, '', 0, 'skipped', reason)
+
+
+def summarize_pages(pages):
+    """Combine PageResults into the {'text', 'confidence', 'pages', 'pageOffsets', 'skippedPages'} result shape.
+
+    pageOffsets holds the character offset of each page in text, so chunks of
+    the text can be traced back to the page they came from. Skipped pages
+    add no text, are left out of the confidence, and are listed with their
+    reason in skippedPages.
+    """
+    page_count = len(pages)
+    extracted = [page for page in pages if page.method != 'skipped']
+    avg_confidence = sum(page.confidence for page in extracted) / len(extracted) if extracted else 0
+    page_offsets = []
+    offset = 0
+    for page in pages:
+        page_offsets.append(offset)
+        if page.method != 'skipped':
+            offset += len(page.text) + 2
+    return {
+        'text': '\n\n'.join(page.text for page in extracted),
+        'confidence': round(avg_confidence, 2),
+        'pages': page_count,
+        'pageOffsets': page_offsets,
+        'skippedPages': [{'page': page.index + 1, 'reason': page.reason} for page in pages if page.method == 'skipped']
+    }
+
+
+class Extractor:
+    """Text extraction from PDFs and images with OCR, shared by both services.
+
+    Pages with a usable text layer are read directly; scanned pages and
+    images are OCR'd on a process pool of config.workers processes, with
+    results cached on disk by content hash. Sources are file paths or bytes.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.cache = ExtractionCache(config.cache_dir, config.cache_max_bytes)
+        self.pool = None
+
+    def get_pool(self):
+        """Return the OCR process pool, or None when running sequentially"""
+        if self.config.workers <= 1:
+            return None
+        # Created lazily so each gunicorn worker owns its pool. The pool processes
+        # come from a forkserver rather than a fork of this worker, whose model,
+        # batcher and event-loop threads may hold locks the children would inherit
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.config.workers, mp_context=multiprocessing.get_context('forkserver')
+            )
+        return self.pool
+
+    def content_key(self, kind, content):
+        """Hash content (bytes or a file path) together with the OCR settings into a cache key"""
+        digest = hashlib.sha256()
+        digest.update(f"{kind}:{self.config.cache_tag()}:".encode('utf-8'))
+        if isinstance(content, str):
+            with open(content, 'rb') as content_file:
+                for block in iter(lambda: content_file.read(UPLOAD_CHUNK_SIZE), b''):
+                    digest.update(block)
+        else:
+            digest.update(content)
+        return digest.hexdigest()
+
+    def submit_ocr(self, pool, fn, *args):
+        """Run fn on the OCR pool when there is one, returning a Future, or in-process otherwise"""
+        if pool is not None:
+            return pool.submit(run_timed, fn, *args, self.config)
+        try:
+            with timed('ocr'):
+                return fn(*args, self.config)
+        except PageSkipped as e:
+            return e
+
+    def start_deadline(self):
+        """The time.monotonic() by which an extraction starting now must finish, or None"""
+        return time.monotonic() + self.config.deadline if self.config.deadline > 0 else None
+
+    def page_guard(self, index, deadline):
+        """The reason to skip a page before starting on it, or None to extract it"""
+        if self.config.max_pages and index >= self.config.max_pages:
+            return 'max_pages'
+        if deadline is not None and time.monotonic() >= deadline:
+            return 'deadline'
+        return None
+
+    def resolve_page(self, index, page_result, cache_key, method, deadline=None):
+        """Wait for a page's OCR to finish, cache it, and return its PageResult"""
+        try:
+            text, page_confidence = ocr_result(page_result, deadline)
+        except PageSkipped as e:
+            return skipped_page(index, e.reason)
+        if cache_key is not None:
+            self.cache.put(cache_key, [text, page_confidence])
+        return PageResult(index, text, page_confidence, method)
+
+    def iter_pdf_pages(self, pdf_source):
+        """Yield a PageResult for each PDF page, in page order.
+
+        Pages past config.max_pages or the deadline, pages too large to
+        render and pages whose OCR times out come back as skipped.
+        """
+        config = self.config
+        deadline = self.start_deadline()
+        doc = open_pdf(pdf_source)
+        pool = self.get_pool()
+        # Keep enough scanned pages in flight to occupy the OCR pool
+        window = max(config.workers * 2, 1)
+        pending = deque()
+
+        try:
+            for page_num in range(len(doc)):
+                reason = self.page_guard(page_num, deadline)
+                if reason is not None:
+                    pending.append((page_num, PageSkipped(reason), None, 'skipped'))
+                    while len(pending) > window:
+                        yield self.resolve_page(*pending.popleft(), deadline)
+                    continue
+                page = doc[page_num]
+
+                # Try direct text extraction first
+                with timed('text_layer'):
+                    text = page.get_text()
+
+                # If no text or very little text, use OCR
+                if not text or len(text.strip()) < config.min_text_chars:
+                    # Renders are capped at config.max_pixels; a page too large to even probe is skipped
+                    limit_dpi = max_render_dpi(page, config)
+                    if limit_dpi is not None and limit_dpi < config.probe_dpi:
+                        pending.append((page_num, PageSkipped('too_large'), None, 'skipped'))
+                        continue
+
+                    # Probe at low resolution to skip blank pages and size the text for OCR
+                    with timed('render'):
+                        probe = render_page(page, config.probe_dpi)
+                        blank, line_height = analyze_page_image(
+                            pixmap_image(probe.samples, probe.width, probe.height, probe.stride), config
+                        )
+                        if not blank:
+                            dpi = choose_render_dpi(line_height, config)
+                            pix = render_page(page, dpi if limit_dpi is None else min(dpi, limit_dpi))
+                    if blank:
+                        PAGES_EXTRACTED.labels('blank').inc()
+                        pending.append((page_num, ('', 0), None, 'blank'))
+                        continue
+
+                    # Pages seen before in any upload are keyed by their rendered pixels
+                    cache_key = self.content_key('page', pix.samples_mv)
+                    cached = self.cache.get('page', cache_key)
+                    if cached is not None:
+                        PAGES_EXTRACTED.labels('cached').inc()
+                        pending.append((page_num, tuple(cached), None, 'cached'))
+                        continue
+
+                    PAGES_EXTRACTED.labels('ocr').inc()
+                    page_image = (pix.samples, pix.width, pix.height, pix.stride)
+                    pending.append((page_num, self.submit_ocr(pool, ocr_page_image, *page_image), cache_key, 'ocr'))
+                else:
+                    PAGES_EXTRACTED.labels('direct').inc()
+                    pending.append((page_num, (text, TEXT_LAYER_CONFIDENCE), None, 'text_layer'))
+
+                while len(pending) > window:
+                    yield self.resolve_page(*pending.popleft(), deadline)
+
+            while pending:
+                yield self.resolve_page(*pending.popleft(), deadline)
+        finally:
+            # Drop queued OCR work if the consumer stopped early
+            for _, page_result, _, _ in pending:
+                if isinstance(page_result, Future):
+                    page_result.cancel()
+            doc.close()
+
+    def iter_image_pages(self, image_source):
+        """Yield a PageResult for each frame of an image, in frame order, skipping frames as iter_pdf_pages does"""
+        deadline = self.start_deadline()
+        pool = self.get_pool()
+        window = max(self.config.workers * 2, 1)
+        pending = deque()
+
+        try:
+            for frame in range(image_frame_count(image_source)):
+                reason = self.page_guard(frame, deadline)
+                if reason is not None:
+                    pending.append((frame, PageSkipped(reason), None, 'skipped'))
+                else:
+                    PAGES_EXTRACTED.labels('image').inc()
+                    pending.append((frame, self.submit_ocr(pool, ocr_image_frame, image_source, frame), None, 'ocr'))
+                while len(pending) > window:
+                    yield self.resolve_page(*pending.popleft(), deadline)
+
+            while pending:
+                yield self.resolve_page(*pending.popleft(), deadline)
+        finally:
+            for _, page_result, _, _ in pending:
+                if isinstance(page_result, Future):
+                    page_result.cancel()
+
+    def extract_pdf(self, pdf_source):
+        """Extract text from PDF using PyMuPDF with OCR fallback"""
+        try:
+            cache_key = self.content_key('pdf', pdf_source)
+            cached = self.cache.get('document', cache_key)
+            if cached is not None:
+                return cached
+
+            result = summarize_pages(list(self.iter_pdf_pages(pdf_source)))
+            if not result['skippedPages']:
+                self.cache.put(cache_key, result)
+            return result
+
+        except Exception as e:
+            raise Exception(f"PDF extraction failed: {str(e)}")
+
+    def extract_image(self, image_source):
+        """Extract text from an image, OCR'ing every frame of a multi-page TIFF"""
+        try:
+            cache_key = self.content_key('image', image_source)
+            cached = self.cache.get('document', cache_key)
+            if cached is not None:
+                return cached
+
+            result = summarize_pages(list(self.iter_image_pages(image_source)))
+            if not result['skippedPages']:
+                self.cache.put(cache_key, result)
+            return result
+
+        except Exception as e:
+            raise Exception(f"Image extraction failed: {str(e)}")
+
+    def extract_images(self, images):
+        """OCR a batch of (filename, source) images concurrently.
+
+        Every frame of every image is queued on the OCR pool at once, so a batch
+        of photos costs one request instead of one per image. Returns the PDF
+        result shape summarized over every frame of the batch, numbered in
+        upload order (images that failed add none), plus a 'results' entry per
+        image holding either its own result or the error that image failed with.
+        config.max_pages and the deadline apply to the batch as a whole.
+        """
+        deadline = self.start_deadline()
+        pool = self.get_pool()
+        results = [None] * len(images)
+        image_pages = [[] for _ in images]
+        queued = {}
+        frames_seen = 0
+
+        try:
+            for index, (filename, image_source) in enumerate(images):
+                try:
+                    cache_key = self.content_key('image', image_source)
+                    cached = self.cache.get('document', cache_key)
+                    # Results cached before pageOffsets existed cannot be split into pages
+                    if cached is not None and 'pageOffsets' in cached:
+                        results[index] = {'filename': filename, **cached}
+                        image_pages[index] = cached_pages(cached)
+                        continue
+                    frames = []
+                    for frame in range(image_frame_count(image_source)):
+                        reason = self.page_guard(frames_seen, deadline)
+                        frames_seen += 1
+                        if reason is not None:
+                            frames.append(PageSkipped(reason))
+                        else:
+                            PAGES_EXTRACTED.labels('image').inc()
+                            frames.append(self.submit_ocr(pool, ocr_image_frame, image_source, frame))
+                    queued[index] = (cache_key, frames)
+                except Exception as e:
+                    results[index] = {'filename': filename, 'error': f"Image extraction failed: {str(e)}"}
+
+            for index, (cache_key, frames) in queued.items():
+                filename = images[index][0]
+                try:
+                    pages = [
+                        self.resolve_page(frame, page_result, None, 'ocr', deadline)
+                        for frame, page_result in enumerate(frames)
+                    ]
+                    result = summarize_pages(pages)
+                    if not result['skippedPages']:
+                        self.cache.put(cache_key, result)
+                    results[index] = {'filename': filename, **result}
+                    image_pages[index] = pages
+                except Exception as e:
+                    results[index] = {'filename': filename, 'error': f"Image extraction failed: {str(e)}"}
+        finally:
+            for _, frames in queued.values():
+                for frame in frames:
+                    if isinstance(frame, Future):
+                        frame.cancel()
+
+        # Number the frames across the batch so the aggregate reads like one multi-page PDF
+        batch_pages = []
+        for pages in image_pages:
+            for page in pages:
+                batch_pages.append(replace(page, index=len(batch_pages)))
+        return {**summarize_pages(batch_pages), 'results': results}
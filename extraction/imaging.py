@@ -0,0 +1,204 @@
+"""Image preprocessing and Tesseract calls.
+
+Everything here is a plain module-level function so it can be submitted to
+the OCR process pool; settings arrive as an ExtractionConfig argument.
+"""
+import io
+import math
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+
+class PageSkipped(Exception):
+    """A page or image frame left out of the result: 'timeout', 'too_large', 'max_pages' or 'deadline'"""
+
+    @property
+    def reason(self):
+        return self.args[0]
+
+
+def otsu_threshold(histogram):
+    """Return (threshold, dark mean, light mean) best separating a 256-bin grayscale histogram"""
+    total = sum(histogram)
+    weighted_total = sum(value * count for value, count in enumerate(histogram))
+    best = (0, 0.0, 0.0)
+    best_variance = -1.0
+    dark_count = 0
+    dark_weighted = 0
+    for value, count in enumerate(histogram):
+        dark_count += count
+        dark_weighted += value * count
+        light_count = total - dark_count
+        if dark_count == 0 or light_count == 0:
+            continue
+        dark_mean = dark_weighted / dark_count
+        light_mean = (weighted_total - dark_weighted) / light_count
+        variance = dark_count * light_count * (light_mean - dark_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best = (value, dark_mean, light_mean)
+    return best
+
+
+def median_level(histogram):
+    """Return the median grey level of a 256-bin histogram"""
+    half = sum(histogram) / 2
+    seen = 0
+    for value, count in enumerate(histogram):
+        seen += count
+        if seen >= half:
+            return value
+    return 255
+
+
+def binarize(gray, threshold):
+    """Map a grayscale image to pure black ink on white at the given threshold"""
+    return gray.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+
+def analyze_page_image(gray, config):
+    """Return (is_blank, text_line_height) for a grayscale page image.
+
+    A page is blank when almost none of it is ink, where ink is any pixel at
+    least config.blank_contrast grey levels away from the paper (the median
+    level). Dust specks and scanner noise stay under the ratio, while faint
+    text well above it is still read. The line height is the median run of
+    inked rows in the binarized image, or None when no text lines can be
+    measured.
+    """
+    histogram = gray.histogram()
+    threshold, _, _ = otsu_threshold(histogram)
+    paper = median_level(histogram)
+    ink = sum(count for value, count in enumerate(histogram) if abs(value - paper) >= config.blank_contrast)
+    if ink / max(gray.width * gray.height, 1) < config.blank_ink_ratio:
+        return True, None
+
+    # Shrink the binarized page to one column: each pixel is its row's mean
+    rows = binarize(gray, threshold).resize((1, gray.height), Image.BOX).getdata()
+    runs = []
+    run = 0
+    for row in list(rows) + [255]:
+        if row < 254:
+            run += 1
+        else:
+            if run >= 2:
+                runs.append(run)
+            run = 0
+    if not runs:
+        return False, None
+    runs.sort()
+    return False, runs[len(runs) // 2]
+
+
+def choose_render_dpi(line_height, config):
+    """Pick the DPI at which a page probed at config.probe_dpi gets OCR-sized text"""
+    if not line_height:
+        return config.dpi
+    dpi = int(config.probe_dpi * config.target_text_height / line_height)
+    return max(config.min_dpi, min(config.dpi, dpi))
+
+
+def choose_image_scale(line_height, config):
+    """Pick the resize factor that gives an image OCR-sized text, 1.0 meaning leave it"""
+    if not line_height:
+        return 1.0
+    scale = max(0.5, min(2.0, config.target_text_height / line_height))
+    return 1.0 if 0.8 <= scale <= 1.25 else scale
+
+
+def ocr_image(gray, config):
+    """Binarize and OCR a grayscale image, returning its text and average confidence"""
+    if config.binarize:
+        gray = binarize(gray, otsu_threshold(gray.histogram())[0])
+
+    # OCR with Tesseract; a timeout of 0 lets it run as long as it needs
+    try:
+        ocr_data = pytesseract.image_to_data(
+            gray, lang=config.lang, output_type=pytesseract.Output.DICT, timeout=config.page_timeout
+        )
+    except RuntimeError as e:
+        if str(e) == 'Tesseract process timeout':
+            raise PageSkipped('timeout')
+        raise
+    text = " ".join([word for word in ocr_data['text'] if word.strip()])
+
+    # Calculate confidence
+    confidences = [int(conf) for conf in ocr_data['conf'] if conf != '-1']
+    page_confidence = sum(confidences) / len(confidences) if confidences else 0
+    return text, page_confidence
+
+
+def pixmap_image(samples, width, height, stride):
+    """Wrap raw grayscale pixmap samples in a PIL image without a PNG round-trip"""
+    return Image.frombuffer('L', (width, height), samples, 'raw', 'L', stride, 1)
+
+
+def ocr_page_image(samples, width, height, stride, config):
+    """OCR a rendered grayscale page, returning its text and average confidence"""
+    return ocr_image(pixmap_image(samples, width, height, stride), config)
+
+
+def open_image(image_source):
+    """Open an image file, raising PageSkipped('too_large') past Pillow's decompression bomb limit"""
+    try:
+        return Image.open(image_source if isinstance(image_source, str) else io.BytesIO(image_source))
+    except Image.DecompressionBombError:
+        raise PageSkipped('too_large')
+
+
+def image_frame_count(image_source):
+    """Number of frames in an image file, e.g. the pages of a multi-page TIFF.
+
+    An image too large to open counts as one frame, which OCR then reports
+    as skipped.
+    """
+    try:
+        with open_image(image_source) as img:
+            return getattr(img, 'n_frames', 1)
+    except PageSkipped:
+        return 1
+
+
+def ocr_image_frame(image_source, frame, config):
+    """OCR one frame of an image file, returning its text and average confidence"""
+    with open_image(image_source) as img:
+        img.seek(frame)
+        if config.max_pixels and img.width * img.height > config.max_pixels:
+            # JPEGs can be decoded at a power-of-two fraction of their size; other formats are skipped
+            scale = math.sqrt(config.max_pixels / (img.width * img.height)) / 2
+            img.draft('L', (int(img.width * scale), int(img.height * scale)))
+            if img.width * img.height > config.max_pixels:
+                raise PageSkipped('too_large')
+        gray = img.convert('L')
+
+    # Skip blank frames, and only resize when the text is too small or large for OCR
+    blank, line_height = analyze_page_image(gray, config)
+    if blank:
+        return '', 0
+    scale = choose_image_scale(line_height, config)
+    if config.max_pixels:
+        scale = min(scale, math.sqrt(config.max_pixels / (gray.width * gray.height)))
+    if scale != 1.0:
+        gray = gray.resize((round(gray.width * scale), round(gray.height * scale)), Image.LANCZOS)
+    return ocr_image(gray, config)
+
+
+def max_render_dpi(page, config):
+    """Highest DPI at which a page renders within config.max_pixels, or None without a limit"""
+    if not config.max_pixels:
+        return None
+    area = max(page.rect.width * page.rect.height, 1)
+    return 72 * math.sqrt(config.max_pixels / area)
+
+
+def render_page(page, dpi):
+    return page.get_pixmap(matrix=fitz.Matrix(dpi/72, dpi/72), colorspace=fitz.csGRAY, alpha=False)
+
+
+def open_pdf(pdf_source):
+    """Open a PDF from a file path (memory-mapped by MuPDF) or from raw bytes"""
+    if isinstance(pdf_source, str):
+        return fitz.open(pdf_source)
+    return fitz.open(stream=pdf_source, filetype="pdf")
@@ -0,0 +1,230 @@
+"""Background jobs for ?async=1 requests, shared by ocr-service and python-service.
+
+Each service builds one JobQueue on its own job table, registers
+make_jobs_blueprint(job_queue) for the /jobs/<id> status routes, and answers
+async requests with job_accepted(job_queue.submit(...)).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from .metrics import log_error
+
+# Background job pool size, queue bound and how long finished jobs are kept
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 16))
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 24 * 3600))
+JOB_RETRY_AFTER_SECONDS = 5
+JOB_POLL_SECONDS = 0.5
+
+
+class JobQueue:
+    """Runs long requests in the background, tracked in a SQLite job table.
+
+    Jobs run on a bounded thread pool in the worker that accepted them; the
+    table is shared by every gunicorn worker so any of them can answer a
+    status poll. Submissions beyond max_pending queued or running jobs are
+    refused so clients back off instead of piling up work.
+    """
+
+    def __init__(self, path, workers=JOB_WORKERS, max_pending=JOB_QUEUE_SIZE, ttl_seconds=JOB_TTL_SECONDS):
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.executor = None
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.counters = {'completed': 0, 'failed': 0, 'queueSeconds': 0.0, 'runSeconds': 0.0}
+        self.initialized = False
+        self.init_lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, cleanup=None):
+        """Queue fn(*args) as a job and return its ID, or None when the queue is full.
+
+        cleanup, if given, runs once the job has finished either way.
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return None
+            self.pending += 1
+            # Created lazily so each gunicorn worker owns its threads after forking
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute('DELETE FROM jobs WHERE finished_at < ?', (now - self.ttl_seconds,))
+                conn.execute(
+                    'INSERT INTO jobs (id, kind, status, pid, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (job_id, kind, 'queued', os.getpid(), now)
+                )
+            self.executor.submit(self._run, job_id, now, fn, args, cleanup)
+        except Exception:
+            with self.lock:
+                self.pending -= 1
+            raise
+        return job_id
+
+    def get(self, job_id):
+        """Return a job's status, timings and (once finished) result or error, or None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT kind, status, pid, created_at, started_at, finished_at, result, error FROM jobs WHERE id = ?',
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            kind, status, pid, created_at, started_at, finished_at, result, error = row
+
+            # A job whose worker process is gone will never finish
+            if status in ('queued', 'running') and pid != os.getpid() and not process_alive(pid):
+                status, finished_at, error = 'failed', time.time(), 'Job was interrupted'
+                conn.execute(
+                    'UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?',
+                    (status, finished_at, error, job_id)
+                )
+
+        timing = {}
+        if started_at is not None:
+            timing['queuedMs'] = round((started_at - created_at) * 1000, 1)
+        if finished_at is not None:
+            if started_at is not None:
+                timing['runMs'] = round((finished_at - started_at) * 1000, 1)
+            timing['totalMs'] = round((finished_at - created_at) * 1000, 1)
+
+        job = {'jobId': job_id, 'kind': kind, 'status': status, 'timing': timing}
+        if status == 'done':
+            job['result'] = json.loads(result)
+        elif status == 'failed':
+            job['error'] = error
+        return job
+
+    def stats(self):
+        """Per-worker queue depth and average job timings"""
+        with self.lock:
+            finished = self.counters['completed'] + self.counters['failed']
+            return {
+                'pending': self.pending,
+                'capacity': self.max_pending,
+                'completed': self.counters['completed'],
+                'failed': self.counters['failed'],
+                'avgQueueMs': round(self.counters['queueSeconds'] * 1000 / finished, 1) if finished else 0,
+                'avgRunMs': round(self.counters['runSeconds'] * 1000 / finished, 1) if finished else 0
+            }
+
+    def _run(self, job_id, created_at, fn, args, cleanup):
+        started = time.time()
+        result = None
+        error = None
+        try:
+            with self._connect() as conn:
+                conn.execute('UPDATE jobs SET status = ?, started_at = ? WHERE id = ?', ('running', started, job_id))
+            result = json.dumps(fn(*args))
+        except Exception as e:
+            log_error('job', f"Job {job_id} failed: {str(e)}")
+            error = str(e)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+        finished = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?',
+                    ('failed' if error is not None else 'done', finished, result, error, job_id)
+                )
+        except sqlite3.Error as e:
+            log_error('job', f"Job table write error: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.counters['failed' if error is not None else 'completed'] += 1
+                self.counters['queueSeconds'] += started - created_at
+                self.counters['runSeconds'] += finished - started
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.initialized:
+            with self.init_lock:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS jobs ('
+                    'id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, pid INTEGER NOT NULL, '
+                    'created_at REAL NOT NULL, started_at REAL, finished_at REAL, result TEXT, error TEXT)'
+                )
+                conn.commit()
+                self.initialized = True
+        return conn
+
+
+def process_alive(pid):
+    """True if a process with this PID exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def wants_async():
+    """True when the client asked for a background job (?async=1 or Prefer: respond-async)"""
+    return (
+        request.args.get('async', '').lower() in ('1', 'true', 'yes')
+        or 'respond-async' in request.headers.get('Prefer', '')
+    )
+
+
+def job_accepted(job_id):
+    """The 202 response for a queued job, or 429 when the queue was full"""
+    if job_id is None:
+        return jsonify({'error': 'Job queue is full, retry later'}), 429, {'Retry-After': str(JOB_RETRY_AFTER_SECONDS)}
+    status_url = f"/jobs/{job_id}"
+    return jsonify({'jobId': job_id, 'status': 'queued', 'statusUrl': status_url}), 202, {'Location': status_url}
+
+
+def make_jobs_blueprint(job_queue):
+    """A blueprint serving GET /jobs/<id> and GET /jobs/<id>/stream from job_queue"""
+    blueprint = Blueprint('jobs', __name__)
+
+    @blueprint.route('/jobs/<job_id>', methods=['GET'])
+    def job_status(job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job), 200
+
+    @blueprint.route('/jobs/<job_id>/stream', methods=['GET'])
+    def job_status_stream(job_id):
+        """Stream a job's status as NDJSON, one event per change, ending with its result or error"""
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+
+        def generate():
+            current = job
+            last_status = None
+            while current is not None:
+                if current['status'] != last_status:
+                    last_status = current['status']
+                    yield json.dumps(current) + '\n'
+                if current['status'] in ('done', 'failed'):
+                    return
+                time.sleep(JOB_POLL_SECONDS)
+                current = job_queue.get(job_id)
+            yield json.dumps({'jobId': job_id, 'status': 'failed', 'error': 'Job expired'}) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    return blueprint
@@ -0,0 +1,98 @@
+"""Prometheus metrics, Server-Timing and error logging shared by both services."""
+import os
+import time
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+
+# Prometheus metrics; set PROMETHEUS_MULTIPROC_DIR to aggregate them across gunicorn workers
+REQUEST_SECONDS = Histogram(
+    'study_buddy_request_seconds', 'Request latency by endpoint and status', ['endpoint', 'status'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'study_buddy_requests_in_flight', 'Requests currently being handled', ['endpoint'], multiprocess_mode='livesum'
+)
+STAGE_SECONDS = Histogram(
+    'study_buddy_stage_seconds', 'Time spent in each processing stage', ['stage'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+PAGES_EXTRACTED = Counter('study_buddy_pages_total', 'Pages extracted, by method', ['method'])
+CACHE_REQUESTS = Counter('study_buddy_cache_requests_total', 'Cache lookups by cache and outcome', ['cache', 'result'])
+ERRORS = Counter('study_buddy_errors_total', 'Errors by stage', ['stage'])
+
+
+def record_stage(stage, seconds):
+    """Observe a stage's duration and add it to the current request's Server-Timing"""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    note_server_timing(stage, seconds)
+
+
+def note_server_timing(stage, seconds):
+    if has_request_context():
+        timings = g.setdefault('stage_timings', {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def log_error(stage, message):
+    """Print an error and count it in the errors metric"""
+    print(message)
+    ERRORS.labels(stage).inc()
+
+
+def make_metrics_blueprint():
+    """A blueprint serving GET /metrics that times every request of the app it is registered on"""
+    blueprint = Blueprint('metrics', __name__)
+
+    @blueprint.before_app_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+    @blueprint.after_app_request
+    def add_server_timing(response):
+        g.response_status = response.status_code
+        if SERVER_TIMING and 'request_started' in g:
+            timings = dict(g.get('stage_timings', {}))
+            timings['total'] = time.perf_counter() - g.request_started
+            response.headers['Server-Timing'] = ", ".join(
+                f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+            )
+        return response
+
+    @blueprint.teardown_app_request
+    def finish_request_metrics(error=None):
+        # Streamed responses can tear down twice; count each request once
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        REQUESTS_IN_FLIGHT.labels(g.metrics_endpoint).dec()
+        status = str(g.get('response_status', 500))
+        REQUEST_SECONDS.labels(g.metrics_endpoint, status).observe(time.perf_counter() - started)
+
+    @blueprint.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus metrics for this worker, or for all workers in multiprocess mode"""
+        registry = REGISTRY
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    return blueprint
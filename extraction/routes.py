@@ -0,0 +1,124 @@
+"""The /extract routes, served identically by ocr-service and python-service."""
+import json
+
+from flask import Blueprint, Response, jsonify, stream_with_context
+
+from .engine import summarize_pages
+from .jobs import job_accepted, wants_async
+from .metrics import log_error
+from .uploads import read_batch_upload, read_upload, remove_temp_file
+
+
+def make_extract_blueprint(extractor, job_queue):
+    """A blueprint serving POST /extract, /extract/batch and /extract/stream.
+
+    Extraction runs on extractor; /extract runs on job_queue instead when the
+    client asks for a background job.
+    """
+    blueprint = Blueprint('extract', __name__)
+
+    @blueprint.route('/extract', methods=['POST'])
+    def extract_text():
+        temp_path = None
+        try:
+            file_data, mime_type, temp_path = read_upload()
+            if file_data is None:
+                return jsonify({'error': 'Missing file or mimeType'}), 400
+
+            if mime_type == 'application/pdf':
+                extract = extractor.extract_pdf
+            elif mime_type.startswith('image/'):
+                extract = extractor.extract_image
+            else:
+                return jsonify({'error': 'Unsupported file type'}), 400
+
+            if wants_async():
+                job_id = job_queue.submit(
+                    'extract', extract, file_data, cleanup=lambda path=temp_path: remove_temp_file(path)
+                )
+                if job_id is not None:
+                    # The job removes the spooled upload once it has finished
+                    temp_path = None
+                return job_accepted(job_id)
+
+            return jsonify(extract(file_data)), 200
+        except Exception as e:
+            log_error('extract', f"Error in extract_text: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+        finally:
+            remove_temp_file(temp_path)
+
+    @blueprint.route('/extract/batch', methods=['POST'])
+    def extract_text_batch():
+        """OCR many images (including multi-page TIFFs) in one request"""
+        temp_paths = []
+        try:
+            images, temp_paths = read_batch_upload()
+            if not images:
+                return jsonify({'error': 'Missing files'}), 400
+
+            unsupported = [filename for filename, _, mime_type in images if not (mime_type or '').startswith('image/')]
+            if unsupported:
+                return jsonify({'error': f"Unsupported file type: {', '.join(unsupported)}"}), 400
+
+            result = extractor.extract_images([(filename, source) for filename, source, _ in images])
+            return jsonify(result), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        finally:
+            for temp_path in temp_paths:
+                remove_temp_file(temp_path)
+
+    @blueprint.route('/extract/stream', methods=['POST'])
+    def extract_text_stream():
+        """Stream extraction results as NDJSON, one event per page as it completes"""
+        temp_path = None
+        try:
+            file_data, mime_type, temp_path = read_upload()
+            if file_data is None:
+                return jsonify({'error': 'Missing file or mimeType'}), 400
+
+            if mime_type == 'application/pdf':
+                pages = extractor.iter_pdf_pages(file_data)
+                error_prefix = 'PDF extraction failed'
+            elif mime_type.startswith('image/'):
+                pages = extractor.iter_image_pages(file_data)
+                error_prefix = 'Image extraction failed'
+            else:
+                remove_temp_file(temp_path)
+                return jsonify({'error': 'Unsupported file type'}), 400
+        except Exception as e:
+            remove_temp_file(temp_path)
+            return jsonify({'error': str(e)}), 500
+
+        def generate():
+            results = []
+            try:
+                for page in pages:
+                    results.append(page)
+                    event = {
+                        'type': 'page',
+                        'page': page.index + 1,
+                        'text': page.text,
+                        'confidence': round(page.confidence, 2),
+                        'method': page.method
+                    }
+                    if page.method == 'skipped':
+                        event['reason'] = page.reason
+                    yield json.dumps(event) + '\n'
+
+                # The page events already carried the text
+                summary = summarize_pages(results)
+                del summary['text']
+                yield json.dumps({'type': 'done', **summary}) + '\n'
+            except Exception as e:
+                yield json.dumps({'type': 'error', 'error': f"{error_prefix}: {str(e)}"}) + '\n'
+            finally:
+                pages.close()
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        # The spooled upload must outlive the route until streaming ends
+        response.call_on_close(lambda: remove_temp_file(temp_path))
+        return response
+
+    return blueprint
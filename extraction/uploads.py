@@ -0,0 +1,88 @@
+"""Reading uploads from the current Flask request, spooling binary bodies to disk."""
+import base64
+import os
+import shutil
+import tempfile
+
+from flask import request
+
+# Buffer size used when spooling binary uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def spool_to_temp_file(stream):
+    """Copy an upload stream to a temporary file in fixed-size chunks and return its path"""
+    fd, temp_path = tempfile.mkstemp(prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            shutil.copyfileobj(stream, temp_file, UPLOAD_CHUNK_SIZE)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return temp_path
+
+
+def read_upload():
+    """Read the uploaded file from the current request.
+
+    Accepts a multipart 'file' field, a raw application/pdf or image/* body,
+    or the original JSON body with a base64 'file' and 'mimeType'. Binary
+    uploads are spooled to a temporary file instead of being held in memory.
+    Returns (source, mime_type, temp_path); source is a file path or bytes,
+    and the caller must remove temp_path when it is not None.
+    """
+    if 'file' in request.files:
+        upload = request.files['file']
+        mime_type = request.form.get('mimeType') or upload.mimetype
+        temp_path = spool_to_temp_file(upload.stream)
+        return temp_path, mime_type, temp_path
+    
+    if request.mimetype == 'application/pdf' or request.mimetype.startswith('image/'):
+        temp_path = spool_to_temp_file(request.stream)
+        return temp_path, request.mimetype, temp_path
+    
+    data = request.get_json(silent=True)
+    if not data or 'file' not in data or 'mimeType' not in data:
+        return None, None, None
+    return base64.b64decode(data['file']), data['mimeType'], None
+
+
+def read_batch_upload():
+    """Read the images uploaded to a batch request.
+
+    Accepts several multipart 'files' (or 'file') fields, each spooled to a
+    temporary file, or a JSON body with a 'files' list of base64 'file' and
+    'mimeType' objects. Returns (images, temp_paths) where images is a list
+    of (filename, source, mime_type); the caller must remove temp_paths.
+    """
+    images = []
+    temp_paths = []
+    uploads = request.files.getlist('files') + request.files.getlist('file')
+    if uploads:
+        try:
+            for index, upload in enumerate(uploads):
+                temp_path = spool_to_temp_file(upload.stream)
+                temp_paths.append(temp_path)
+                images.append((upload.filename or f"image-{index + 1}", temp_path, upload.mimetype))
+        except Exception:
+            for temp_path in temp_paths:
+                remove_temp_file(temp_path)
+            raise
+        return images, temp_paths
+    
+    data = request.get_json(silent=True)
+    for index, item in enumerate((data or {}).get('files') or []):
+        if isinstance(item, dict) and 'file' in item and 'mimeType' in item:
+            images.append((
+                item.get('filename') or f"image-{index + 1}", base64.b64decode(item['file']), item['mimeType']
+            ))
+    return images, temp_paths
+
+
+def remove_temp_file(temp_path):
+    """Delete a spooled upload, ignoring files that are already gone"""
+    if temp_path is not None:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
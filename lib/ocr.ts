@@ -1,27 +1,27 @@
-import fetch from 'node-fetch'
-
 interface OCRResult {
   text: string
   confidence: number
   pages: number
 }
 
+interface OCRPage {
+  page: number
+  text: string
+  confidence: number
+}
+
 /**
  * Extract text using PyMuPDF microservice
  */
 async function extractTextWithPyMuPDF(fileBuffer: Buffer, mimeType: string): Promise<OCRResult> {
   try {
-    const base64File = fileBuffer.toString('base64')
-    
+    // Send the raw file so the service can spool it to disk instead of decoding base64
     const response = await fetch('http://localhost:5000/extract', {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json',
+        'Content-Type': mimeType,
       },
-      body: JSON.stringify({
-        file: base64File,
-        mimeType: mimeType
-      })
+      body: fileBuffer
     })
     
     if (!response.ok) {
@@ -42,6 +42,72 @@ async function extractTextWithPyMuPDF(fileBuffer: Buffer, mimeType: string): Pro
   }
 }
 
+/**
+ * Stream extracted text page by page as the microservice produces it.
+ * Yields each page as soon as it is ready and returns the overall result.
+ */
+export async function* streamText(fileBuffer: Buffer, mimeType: string): AsyncGenerator<OCRPage, OCRResult> {
+  const response = await fetch('http://localhost:5000/extract/stream', {
+    method: 'POST',
+    headers: {
+      'Content-Type': mimeType,
+    },
+    body: fileBuffer
+  })
+  
+  if (!response.ok) {
+    const error = await response.json()
+    throw new Error('Failed to extract text: ' + (error.error || 'OCR processing failed'))
+  }
+  
+  if (!response.body) {
+    throw new Error('Failed to extract text: OCR stream has no body')
+  }
+  
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  const pageTexts: string[] = []
+  let buffered = ''
+  
+  try {
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) break
+      buffered += decoder.decode(value, { stream: true })
+      
+      let newline = buffered.indexOf('\n')
+      while (newline !== -1) {
+        const line = buffered.slice(0, newline).trim()
+        buffered = buffered.slice(newline + 1)
+        newline = buffered.indexOf('\n')
+        if (!line) continue
+        
+        const event = JSON.parse(line)
+        if (event.type === 'page') {
+          // Skipped pages carry no text and are left out of the joined result, as in /extract
+          if (event.method !== 'skipped') {
+            pageTexts.push(event.text)
+          }
+          yield { page: event.page, text: event.text, confidence: event.confidence }
+        } else if (event.type === 'error') {
+          throw new Error('Failed to extract text: ' + event.error)
+        } else if (event.type === 'done') {
+          return {
+            text: pageTexts.join('\n\n').trim(),
+            confidence: event.confidence,
+            pages: event.pages
+          }
+        }
+      }
+    }
+  } finally {
+    // Stops the service side too when the caller returns early or an error event ends the stream
+    reader.cancel().catch(() => {})
+  }
+  
+  throw new Error('Failed to extract text: OCR stream ended unexpectedly')
+}
+
 /**
  * Extract text from PDF
  */
@@ -1,118 +1,1132 @@
-from flask import Flask, request, jsonify
+import time
+# Measured from the first line so the startup report covers every import
+MODULE_STARTED = time.perf_counter()
+
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 from flask_cors import CORS
-import fitz  
-from PIL import Image
-import io
-import base64
-import pytesseract
 import os
+import shutil
+import stat
+import tempfile
+import hashlib
+import threading
 from dotenv import load_dotenv
 load_dotenv() 
 import json
-from langchain_groq import ChatGroq
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+# LangChain integrations, sentence-transformers and the HTTP client are
+# imported where they are first used so /health and /extract come up
+# without paying for them; see load_models()
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from datetime import datetime, timedelta
 import re
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+import queue
+import sqlite3
+import asyncio
+import fcntl
+import numpy as np
+from concurrent.futures import Future
+from prometheus_client import Counter
+from extraction import (
+    ExtractionConfig, Extractor, JobQueue, job_accepted, log_error, make_extract_blueprint, make_jobs_blueprint,
+    make_metrics_blueprint, record_stage, timed, wants_async
+)
+from extraction.metrics import CACHE_REQUESTS
 
 app = Flask(__name__)
 CORS(app)
 
-# Initialize Groq LLM
+# Groq LLM settings
 GROQ_API_KEY = os.environ.get('GROQ_API_KEY')
-llm = ChatGroq(
-    groq_api_key=GROQ_API_KEY,
-    model_name="llama-3.3-70b-versatile",
-    temperature=0.7
+LLM_MODEL = "llama-3.3-70b-versatile"
+
+# OpenAI-compatible endpoint used for concurrent completions; point it at a
+# local stub server for tests and benchmarks
+LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://api.groq.com/openai/v1')
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 120))
+
+# LLM response cache; a size of 0 disables it
+LLM_CACHE_PATH = os.environ.get(
+    'LLM_CACHE_PATH', os.path.join(tempfile.gettempdir(), 'study-buddy-llm-cache.sqlite3')
 )
+LLM_CACHE_TTL_SECONDS = int(os.environ.get('LLM_CACHE_TTL_SECONDS', 24 * 3600))
+LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Quizzes larger than this are generated as concurrent batches; 0 disables it
+QUIZ_BATCH_SIZE = int(os.environ.get('QUIZ_BATCH_SIZE', 10))
+
+# Study plans longer than this many days are generated as concurrent segments
+# of this length after an outline pass; 0 disables it
+STUDY_PLAN_SEGMENT_DAYS = int(os.environ.get('STUDY_PLAN_SEGMENT_DAYS', 7))
+
+# Embedding model
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
-# Initialize embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
+# How the embedding model is run:
+#   torch - sentence-transformers on PyTorch, float32 (default)
+#   onnx  - an ONNX export of the same model on ONNX Runtime, by default the int8
+#           quantized one written by export_onnx_model.py; loads from local files only
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_ONNX_PATH = os.environ.get('EMBEDDING_ONNX_PATH', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'models', 'all-MiniLM-L6-v2-onnx', 'model_int8.onnx'
+))
+# Backends give slightly different vectors, so cached embeddings and indexes are kept per backend
+EMBEDDING_ID = (
+    EMBEDDING_MODEL if EMBEDDING_BACKEND == 'torch'
+    else f"{EMBEDDING_MODEL}:onnx:{os.path.basename(EMBEDDING_ONNX_PATH)}"
 )
 
-def extract_text_from_pdf(pdf_bytes):
-    """Extract text from PDF using PyMuPDF with OCR fallback"""
+# When to load the embedding model and LLM client:
+#   background - each worker starts loading on its first request (default)
+#   preload    - load at import; with `gunicorn --preload` this happens once in
+#                the master and forked workers share the model pages copy-on-write
+MODEL_LOADING = os.environ.get('MODEL_LOADING', 'background')
+
+# Embedding micro-batching across concurrent requests
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 64))
+EMBED_BATCH_WAIT_MS = float(os.environ.get('EMBED_BATCH_WAIT_MS', 10))
+# Threads the embedding model runs on, for either backend
+EMBED_TORCH_THREADS = int(os.environ.get('EMBED_TORCH_THREADS', os.cpu_count() or 1))
+
+# Chunk-level embedding cache shared by all indexes; 0 rows disables it
+EMBEDDING_CACHE_DIR = os.environ.get(
+    'EMBEDDING_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'study-buddy-embedding-cache')
+)
+EMBEDDING_CACHE_MAX_ROWS = int(os.environ.get('EMBEDDING_CACHE_MAX_ROWS', 1000000))
+
+# Text splitting used for every vector store; part of the index cache key.
+# Chunks are whole sentences, at most CHUNK_SIZE characters including up to
+# CHUNK_OVERLAP characters repeated from the chunk before. A chunk usually ends
+# once its own text reaches CHUNK_MIN_SIZE; a single longer sentence is one chunk
+CHUNK_SIZE = 1000
+CHUNK_MIN_SIZE = 400
+CHUNK_OVERLAP = 200
+
+# Retrieved context is sized in (estimated) tokens: a base budget plus a share
+# per quiz question or study plan day, capped per completion. MMR_LAMBDA
+# trades relevance (1.0) against spreading chunks over the document (0.0)
+CONTEXT_BASE_TOKENS = int(os.environ.get('CONTEXT_BASE_TOKENS', 600))
+CONTEXT_TOKENS_PER_ITEM = int(os.environ.get('CONTEXT_TOKENS_PER_ITEM', 100))
+CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', 4000))
+MMR_LAMBDA = float(os.environ.get('MMR_LAMBDA', 0.5))
+
+# Persistent FAISS index store, keyed by content hash
+INDEX_CACHE_DIR = os.environ.get(
+    'INDEX_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'study-buddy-index-cache')
+)
+INDEX_CACHE_MAX_BYTES = int(os.environ.get('INDEX_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+INDEX_CACHE_TTL_SECONDS = int(os.environ.get('INDEX_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+# Budget for indexes kept loaded in this worker
+INDEX_MEMORY_MAX_BYTES = int(os.environ.get('INDEX_MEMORY_MAX_BYTES', 256 * 1024 * 1024))
+
+# OCR_*, EXTRACTION_CACHE_* and the other extraction tunables are read by ExtractionConfig.from_env()
+extractor = Extractor(ExtractionConfig.from_env())
+
+# Background jobs for ?async=1 requests; the job table is shared by all workers.
+# JOB_WORKERS, JOB_QUEUE_SIZE and JOB_TTL_SECONDS are read by extraction.jobs
+JOB_DB_PATH = os.environ.get(
+    'JOB_DB_PATH', os.path.join(tempfile.gettempdir(), 'study-buddy-jobs.sqlite3')
+)
+
+# Fallback and token metrics; the request, stage, page, cache and error metrics live in
+# extraction.metrics. Set PROMETHEUS_MULTIPROC_DIR to aggregate them across gunicorn workers
+FALLBACKS = Counter(
+    'study_buddy_fallback_generations_total', 'Responses built from fallback templates', ['kind']
+)
+LLM_PROMPT_TOKENS = Counter('study_buddy_llm_prompt_tokens_total', 'Estimated prompt tokens sent to the LLM')
+
+startup_report = {
+    'mode': MODEL_LOADING,
+    'embeddingBackend': EMBEDDING_BACKEND,
+    'importSeconds': None,
+    'embeddingsLoadSeconds': None,
+    'llmInitSeconds': None,
+    'readySeconds': None,
+    'error': None
+}
+
+_embeddings_lock = threading.Lock()
+_loader_lock = threading.Lock()
+_models_ready = threading.Event()
+_loader_thread = None
+_model_embeddings = None
+
+def get_model_embeddings():
+    """Return the embedding model for EMBEDDING_BACKEND, loading it on first use"""
+    global _model_embeddings
+    if _model_embeddings is None:
+        with _embeddings_lock:
+            if _model_embeddings is None:
+                started = time.perf_counter()
+                if EMBEDDING_BACKEND == 'onnx':
+                    _model_embeddings = OnnxEmbeddings(EMBEDDING_ONNX_PATH, EMBED_BATCH_SIZE, EMBED_TORCH_THREADS)
+                else:
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+                    _model_embeddings = HuggingFaceEmbeddings(
+                        model_name=EMBEDDING_MODEL,
+                        encode_kwargs={'batch_size': EMBED_BATCH_SIZE}
+                    )
+                startup_report['embeddingsLoadSeconds'] = round(time.perf_counter() - started, 2)
+    return _model_embeddings
+
+def load_models():
+    """Load the embedding model and LLM client and mark the service ready"""
     try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        full_text = []
-        total_confidence = 0
-        page_count = len(doc)
-        
-        for page_num in range(page_count):
-            page = doc[page_num]
-            text = page.get_text()
+        get_model_embeddings()
+        
+        # Only import the HTTP client here; its event loop starts on first use in each worker
+        started = time.perf_counter()
+        import httpx  # noqa: F401
+        startup_report['llmInitSeconds'] = round(time.perf_counter() - started, 2)
+    except Exception as e:
+        startup_report['error'] = str(e)
+        log_error('model_loading', f"Model loading error: {str(e)}")
+        return
+    
+    if not _models_ready.is_set():
+        startup_report['error'] = None
+        startup_report['readySeconds'] = round(time.perf_counter() - MODULE_STARTED, 2)
+        _models_ready.set()
+        print(f"Models ready: {startup_report}")
+
+def start_background_loading():
+    """Start loading models on a background thread, once per worker"""
+    global _loader_thread
+    with _loader_lock:
+        if _loader_thread is None or (not _loader_thread.is_alive() and not _models_ready.is_set()):
+            _loader_thread = threading.Thread(target=load_models, name='model-loader', daemon=True)
+            _loader_thread.start()
+
+class AsyncLLMClient:
+    """Runs chat completions concurrently over one pooled async HTTP client.
+
+    A dedicated event loop thread owns an httpx.AsyncClient, so keep-alive
+    connections to LLM_BASE_URL are reused by every request in this worker,
+    and a semaphore caps in-flight completions at LLM_MAX_CONCURRENCY.
+    """
+    
+    def __init__(self, base_url, api_key, model, max_concurrency, timeout):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.loop = None
+        self.client = None
+        self.semaphore = None
+        self.start_lock = threading.Lock()
+    
+    def submit(self, prompt, temperature=0.7):
+        """Start a completion and return a concurrent.futures.Future of its text"""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._complete(prompt, temperature), self.loop)
+    
+    def stream(self, prompt, sink, tag=None, temperature=0.7):
+        """Start a streamed completion that puts (tag, text delta) pairs on sink.
+
+        The stream ends with (tag, None), or (tag, exception) if it failed.
+        Returns a concurrent.futures.Future of the full text; cancelling it
+        closes the connection and stops generation.
+        """
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._stream(prompt, temperature, sink, tag), self.loop)
+    
+    def _ensure_started(self):
+        # Started lazily so the loop thread belongs to the forked gunicorn worker
+        with self.start_lock:
+            if self.loop is not None:
+                return
+            import httpx
             
-            if not text or len(text.strip()) < 50:
-                pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-                img_data = pix.tobytes("png")
-                img = Image.open(io.BytesIO(img_data))
-                ocr_data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-                text = " ".join([word for word in ocr_data['text'] if word.strip()])
-                confidences = [int(conf) for conf in ocr_data['conf'] if conf != '-1']
-                page_confidence = sum(confidences) / len(confidences) if confidences else 0
-                total_confidence += page_confidence
-            else:
-                total_confidence += 95
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='llm-client', daemon=True).start()
+            
+            async def setup():
+                self.client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers={'Authorization': f"Bearer {self.api_key}"},
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency
+                    )
+                )
+                self.semaphore = asyncio.Semaphore(self.max_concurrency)
             
-            full_text.append(text)
+            asyncio.run_coroutine_threadsafe(setup(), loop).result()
+            self.loop = loop
+    
+    async def _complete(self, prompt, temperature):
+        async with self.semaphore:
+            with timed('llm'):
+                response = await self.client.post('/chat/completions', json={
+                    'model': self.model,
+                    'messages': [{'role': 'user', 'content': prompt}],
+                    'temperature': temperature
+                })
+                response.raise_for_status()
+                return response.json()['choices'][0]['message']['content']
+    
+    async def _stream(self, prompt, temperature, sink, tag):
+        parts = []
+        try:
+            async with self.semaphore:
+                started = time.perf_counter()
+                with timed('llm'):
+                    async with self.client.stream('POST', '/chat/completions', json={
+                        'model': self.model,
+                        'messages': [{'role': 'user', 'content': prompt}],
+                        'temperature': temperature,
+                        'stream': True
+                    }) as response:
+                        response.raise_for_status()
+                        # Server-sent events, one "data: {...}" line per chunk
+                        async for line in response.aiter_lines():
+                            if not line.startswith('data:'):
+                                continue
+                            payload = line[len('data:'):].strip()
+                            if payload == '[DONE]':
+                                break
+                            choices = json.loads(payload).get('choices') or []
+                            delta = (choices[0].get('delta') or {}).get('content') if choices else None
+                            if delta:
+                                if not parts:
+                                    record_stage('llm_first_token', time.perf_counter() - started)
+                                parts.append(delta)
+                                sink.put((tag, delta))
+        except Exception as e:
+            sink.put((tag, e))
+            raise
+        sink.put((tag, None))
+        return "".join(parts)
+
+llm_client = AsyncLLMClient(
+    LLM_BASE_URL, GROQ_API_KEY, LLM_MODEL, LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS
+)
+
+class LLMResponseCache:
+    """SQLite-backed cache of LLM responses with a TTL and a size bound.
+
+    Keys hash the prompt template, the IDs of the retrieved chunks and the
+    query string, so a retried or reloaded request with the same inputs
+    skips the LLM round-trip. Entries older than LLM_CACHE_TTL_SECONDS are
+    ignored and the least recently used ones are deleted once the stored
+    responses exceed LLM_CACHE_MAX_BYTES.
+    """
+    
+    def __init__(self, path, ttl_seconds, max_bytes):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.initialized = False
+        self.init_lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+    
+    def key(self, template, docs, query):
+        digest = hashlib.sha256()
+        digest.update(f"{LLM_MODEL}\0{template}\0".encode('utf-8'))
+        for doc in docs:
+            digest.update(chunk_id(doc.page_content).encode('utf-8'))
+        digest.update(f"\0{query}".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """Return the cached response for key, or None when missing or expired"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    'SELECT response FROM responses WHERE key = ? AND created_at >= ?',
+                    (key, time.time() - self.ttl_seconds)
+                ).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE responses SET used_at = ? WHERE key = ?', (time.time(), key))
+                return row[0] if row else None
+        except sqlite3.Error as e:
+            log_error('llm_cache', f"LLM cache read error: {str(e)}")
+            return None
+    
+    def put(self, key, response):
+        """Store a response, evicting expired and least recently used entries"""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO responses (key, response, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)',
+                    (key, response, len(response), now, now)
+                )
+                conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl_seconds,))
+                total_bytes = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if total_bytes > self.max_bytes:
+                    rows = conn.execute('SELECT key, size FROM responses ORDER BY used_at').fetchall()
+                    for old_key, size in rows:
+                        if total_bytes <= self.max_bytes:
+                            break
+                        conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                        total_bytes -= size
+        except sqlite3.Error as e:
+            log_error('llm_cache', f"LLM cache write error: {str(e)}")
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self.initialized:
+            with self.init_lock:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS responses ('
+                    'key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, '
+                    'created_at REAL NOT NULL, used_at REAL NOT NULL)'
+                )
+                conn.commit()
+                self.initialized = True
+        return conn
+
+llm_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES)
+
+def chunk_id(text):
+    """Stable ID of a retrieved chunk, derived from its text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def prepare_completion(template, docs, query, use_cache=True):
+    """Fill template with the retrieved docs and query and look it up in the response cache.
+
+    Returns (prompt, cache key, cached response); the key is None when the
+    cache is disabled or use_cache is False because the client opted out.
+    Outcomes are recorded on flask.g for the response headers.
+    """
+    prompt = template.format(
+        context="\n\n".join(doc.page_content for doc in docs),
+        question=query
+    )
+    use_cache = use_cache and llm_cache.enabled
+    stats = g.setdefault('llm_cache', {'hits': 0, 'misses': 0, 'hitLatencyMs': 0.0}) if has_request_context() else None
+    
+    if not use_cache:
+        note_prompt_tokens(prompt, docs)
+        return prompt, None, None
+    
+    started = time.perf_counter()
+    key = llm_cache.key(template, docs, query)
+    cached = llm_cache.get(key)
+    CACHE_REQUESTS.labels('llm', 'miss' if cached is None else 'hit').inc()
+    if stats is not None:
+        if cached is not None:
+            stats['hits'] += 1
+            stats['hitLatencyMs'] += (time.perf_counter() - started) * 1000
+        else:
+            stats['misses'] += 1
+    if cached is None:
+        note_prompt_tokens(prompt, docs)
+    return prompt, key, cached
+
+def note_prompt_tokens(prompt, docs):
+    """Count the tokens of a prompt about to be sent to the LLM, per request on flask.g"""
+    tokens = estimate_tokens(prompt)
+    LLM_PROMPT_TOKENS.inc(tokens)
+    if has_request_context():
+        usage = g.setdefault('llm_tokens', {'prompt': 0, 'context': 0})
+        usage['prompt'] += tokens
+        usage['context'] += sum(estimate_tokens(doc.page_content) for doc in docs)
+
+def cache_completion(future, key):
+    """Store the completion's text under key once it finishes successfully"""
+    if key is None:
+        return
+    
+    def store(done):
+        if not done.cancelled() and done.exception() is None:
+            llm_cache.put(key, done.result())
+    future.add_done_callback(store)
+
+def completed_future(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+def submit_completion(template, docs, query, use_cache=True):
+    """Start the completion for template, docs and query; returns a Future of its text"""
+    prompt, key, cached = prepare_completion(template, docs, query, use_cache)
+    if cached is not None:
+        return completed_future(cached)
+    
+    future = llm_client.submit(prompt)
+    cache_completion(future, key)
+    return future
+
+def stream_completion(template, docs, query, sink, tag=None, use_cache=True):
+    """Stream the completion onto sink as (tag, delta) pairs, ending with (tag, None).
+
+    A cached response is replayed as a single delta. Returns a Future of
+    the full text that can be cancelled to stop generation.
+    """
+    prompt, key, cached = prepare_completion(template, docs, query, use_cache)
+    if cached is not None:
+        sink.put((tag, cached))
+        sink.put((tag, None))
+        return completed_future(cached)
+    
+    future = llm_client.stream(prompt, sink, tag)
+    cache_completion(future, key)
+    return future
+
+class EmbeddingBatcher(Embeddings):
+    """Coalesces embedding calls from concurrent requests into larger model batches.
+
+    Callers submit texts and get a Future back; a dedicated thread collects
+    submissions until EMBED_BATCH_SIZE texts are queued or EMBED_BATCH_WAIT_MS
+    has passed since the first one, runs a single model call, and splits the
+    vectors back out. Only that thread runs the model, limited to
+    EMBED_TORCH_THREADS, so request threads no longer contend for the cores.
+    """
+    
+    def __init__(self, load_base, max_batch_size, max_wait_ms, torch_threads):
+        self.load_base = load_base
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.torch_threads = torch_threads
+        self.queue = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+    
+    def submit(self, texts):
+        """Queue texts for embedding and return a Future of their vectors"""
+        # Started lazily so the thread belongs to the forked gunicorn worker
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+                self.thread.start()
         
-        doc.close()
-        avg_confidence = total_confidence / page_count if page_count > 0 else 0
+        future = Future()
+        self.queue.put((list(texts), future))
+        return future
+    
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        return self.submit(texts).result()
+    
+    def embed_query(self, text):
+        return self.submit([text]).result()[0]
+    
+    def _run(self):
+        if EMBEDDING_BACKEND == 'torch':
+            import torch
+            torch.set_num_threads(self.torch_threads)
         
-        return {
-            'text': '\n\n'.join(full_text),
-            'confidence': round(avg_confidence, 2),
-            'pages': page_count
-        }
-    except Exception as e:
-        raise Exception(f"PDF extraction failed: {str(e)}")
+        while True:
+            batch = [self.queue.get()]
+            batch_size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            
+            while batch_size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                batch_size += len(item[0])
+            
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                with timed('embed'):
+                    vectors = self.load_base().embed_documents(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
 
-def extract_text_from_image(image_bytes):
-    """Extract text from image using Tesseract OCR"""
-    try:
-        img = Image.open(io.BytesIO(image_bytes))
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        img = img.resize((img.width * 2, img.height * 2), Image.LANCZOS)
-        ocr_data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-        text = " ".join([word for word in ocr_data['text'] if word.strip()])
-        confidences = [int(conf) for conf in ocr_data['conf'] if conf != '-1']
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+class OnnxEmbeddings(Embeddings):
+    """EMBEDDING_MODEL run from an ONNX export with ONNX Runtime.
+
+    Gives the same mean-pooled, L2-normalized vectors as the
+    sentence-transformers pipeline, reading the tokenizer from the
+    tokenizer.json exported next to the model file. Texts are batched by
+    token length so little of each batch is padding.
+    """
+    
+    # all-MiniLM-L6-v2's max_seq_length; longer texts are truncated as sentence-transformers does
+    MAX_TOKENS = 256
+    
+    def __init__(self, model_path, batch_size, threads):
+        import onnxruntime
+        from tokenizers import Tokenizer
         
-        return {
-            'text': text,
-            'confidence': round(avg_confidence, 2),
-            'pages': 1
-        }
-    except Exception as e:
-        raise Exception(f"Image extraction failed: {str(e)}")
-
-def create_vector_store(text):
-    """Create FAISS vector store from text"""
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    chunks = text_splitter.split_text(text)
-    vectorstore = FAISS.from_texts(chunks, embeddings)
-    return vectorstore
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(os.path.dirname(model_path), 'tokenizer.json'))
+        self.tokenizer.enable_truncation(self.MAX_TOKENS)
+        self.tokenizer.no_padding()
+        self.batch_size = batch_size
+    
+    def embed_documents(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        order = sorted(range(len(encodings)), key=lambda index: len(encodings[index].ids))
+        vectors = [None] * len(encodings)
+        
+        for begin in range(0, len(order), self.batch_size):
+            batch = order[begin:begin + self.batch_size]
+            width = max(len(encodings[index].ids) for index in batch)
+            input_ids = np.zeros((len(batch), width), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), width), dtype=np.int64)
+            for row, index in enumerate(batch):
+                ids = encodings[index].ids
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+            
+            feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self.input_names:
+                feeds['token_type_ids'] = np.zeros_like(input_ids)
+            hidden = self.session.run(None, feeds)[0]
+            
+            # Mean over real tokens, then normalize, as the sentence-transformers pipeline does
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            for row, index in enumerate(batch):
+                vectors[index] = pooled[row].tolist()
+        return vectors
+    
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
 
-def generate_quiz_questions(content, topic, question_count, difficulty, question_types):
-    """Generate quiz questions using RAG"""
-    try:
-        # Create vector store
-        vectorstore = create_vector_store(content)
+batched_embeddings = EmbeddingBatcher(
+    get_model_embeddings, EMBED_BATCH_SIZE, EMBED_BATCH_WAIT_MS, EMBED_TORCH_THREADS
+)
+
+class EmbeddingCache(Embeddings):
+    """Chunk-level embedding cache in front of the embedding model.
+
+    Vectors are appended as float32 rows to a file that is memory-mapped
+    for reads, alongside a file of 32-byte SHA-256 keys of the
+    whitespace-normalized chunk text, one per row. Appends hold an
+    exclusive file lock so every gunicorn worker can share one store, and
+    each worker picks up rows written by the others on its next lookup.
+    Once EMBEDDING_CACHE_MAX_ROWS is reached new vectors are no longer kept.
+    """
+    
+    KEY_SIZE = 32
+    
+    def __init__(self, base, cache_dir, max_rows):
+        self.base = base
+        self.cache_dir = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', EMBEDDING_ID))
+        self.max_rows = max_rows
+        self.keys_path = os.path.join(self.cache_dir, 'keys.bin')
+        self.vectors_path = os.path.join(self.cache_dir, 'vectors.f32')
+        self.lock_path = os.path.join(self.cache_dir, 'lock')
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.vectors = None
+        self.dim = None
+        self.counters = {'hits': 0, 'misses': 0}
+    
+    def embed_documents(self, texts):
+        if self.max_rows <= 0:
+            return self.base.embed_documents(texts)
         
-        # Build question types string
-        types_str = ", ".join(question_types)
+        keys = [self._key(text) for text in texts]
+        with self.lock:
+            self._refresh()
+            vectors = self.vectors
+            found = {key: self.rows[key] for key in keys if key in self.rows}
+        
+        # Embed each distinct missing chunk once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
         
-        # Create prompt template - simplified to only use {context} and {question}
-        prompt_template = """You are an expert quiz generator. Based on the following content, generate quiz questions.
+        computed = {}
+        if missing:
+            computed = dict(zip(missing, self.base.embed_documents(list(missing.values()))))
+            self._append(computed)
+        
+        with self.lock:
+            self.counters['hits'] += len(keys) - len(missing)
+            self.counters['misses'] += len(missing)
+        CACHE_REQUESTS.labels('embedding', 'hit').inc(len(keys) - len(missing))
+        CACHE_REQUESTS.labels('embedding', 'miss').inc(len(missing))
+        
+        return [
+            list(computed[key]) if key in computed else vectors[found[key]].tolist()
+            for key in keys
+        ]
+    
+    def embed_query(self, text):
+        return self.base.embed_query(text)
+    
+    def stats(self):
+        """Return hit/miss counters and store size for capacity planning"""
+        with self.lock:
+            self._refresh()
+            rows = len(self.rows)
+            return {
+                **self.counters,
+                'rows': rows,
+                'maxRows': self.max_rows,
+                'dimensions': self.dim,
+                'bytes': rows * (self.KEY_SIZE + 4 * (self.dim or 0))
+            }
+    
+    def _key(self, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(normalized.encode('utf-8')).digest()
+    
+    def _refresh(self):
+        # Caller holds self.lock; maps rows appended since the last refresh
+        try:
+            keys_size = os.path.getsize(self.keys_path)
+        except OSError:
+            return
+        row_count = keys_size // self.KEY_SIZE
+        if row_count <= len(self.rows):
+            return
+        
+        if self.dim is None:
+            with open(os.path.join(self.cache_dir, 'meta.json'), 'r') as meta_file:
+                self.dim = json.load(meta_file)['dimensions']
+        
+        with open(self.keys_path, 'rb') as keys_file:
+            keys_file.seek(len(self.rows) * self.KEY_SIZE)
+            new_keys = keys_file.read((row_count - len(self.rows)) * self.KEY_SIZE)
+        for offset in range(0, len(new_keys), self.KEY_SIZE):
+            self.rows.setdefault(new_keys[offset:offset + self.KEY_SIZE], len(self.rows))
+        
+        self.vectors = np.memmap(
+            self.vectors_path, dtype=np.float32, mode='r', shape=(row_count, self.dim)
+        )
+    
+    def _append(self, computed):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.lock_path, 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                with self.lock:
+                    self._refresh()
+                    new_items = [(key, vector) for key, vector in computed.items() if key not in self.rows]
+                    new_items = new_items[:max(self.max_rows - len(self.rows), 0)]
+                    if not new_items:
+                        return
+                    
+                    if self.dim is None:
+                        self.dim = len(new_items[0][1])
+                        with open(os.path.join(self.cache_dir, 'meta.json'), 'w') as meta_file:
+                            json.dump({'model': EMBEDDING_ID, 'dimensions': self.dim}, meta_file)
+                    
+                    # Drop rows left by an interrupted append, then write vectors
+                    # before keys so every key always has its row
+                    if os.path.exists(self.vectors_path):
+                        os.truncate(self.vectors_path, len(self.rows) * self.dim * 4)
+                    with open(self.vectors_path, 'ab') as vectors_file:
+                        vectors_file.write(np.asarray([vector for _, vector in new_items], dtype=np.float32).tobytes())
+                    with open(self.keys_path, 'ab') as keys_file:
+                        keys_file.write(b''.join(key for key, _ in new_items))
+                    self._refresh()
+        except Exception as e:
+            log_error('embedding_cache', f"Embedding cache write error: {str(e)}")
+
+embeddings = EmbeddingCache(batched_embeddings, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ROWS)
+
+PARAGRAPH = re.compile(r'\S.*?(?=\s*\n\s*\n|\s*\Z)', re.DOTALL)
+SENTENCE = re.compile(r'\S.*?(?:[.!?]+["\')\]]*(?=\s)|\Z)', re.DOTALL)
+
+def iter_sentences(text):
+    """Yield (start, end, ends_paragraph) spans of text's sentences, none longer than CHUNK_SIZE"""
+    for paragraph in PARAGRAPH.finditer(text):
+        sentences = list(SENTENCE.finditer(text, paragraph.start(), paragraph.end()))
+        for index, sentence in enumerate(sentences):
+            start, end = sentence.start(), sentence.end()
+            # Over-long runs without sentence ends are cut at the last space that fits
+            while end - start > CHUNK_SIZE:
+                cut = text.rfind(' ', start + 1, start + CHUNK_SIZE)
+                cut = cut if cut > start else start + CHUNK_SIZE
+                yield start, cut, False
+                start = cut
+                while start < end and text[start].isspace():
+                    start += 1
+            yield start, end, index == len(sentences) - 1
+
+def iter_chunks(text, page_offsets=None):
+    """Split text into Documents of whole sentences, with stable IDs and offsets.
+
+    A chunk ends at a paragraph break or at a sentence whose hash picks it,
+    once it holds CHUNK_MIN_SIZE characters, and always before it would
+    exceed CHUNK_SIZE. Boundaries only depend on nearby text, so an edit
+    changes the chunks around it and the rest keep their text and ID.
+    Metadata holds the chunk ID, its start and end offsets in text and,
+    given the character offset of each page, the page it starts on.
+    """
+    current = []  # (start, end) of the sentences in the chunk being built
+    overlap = 0   # how many of them are carried over from the previous chunk
+    
+    def emit():
+        start, end = current[overlap][0], current[-1][1]
+        chunk_start = current[0][0]
+        content = text[chunk_start:end]
+        page = bisect_right(page_offsets, start) if page_offsets else None
+        return Document(page_content=content, metadata={
+            'id': chunk_id(content), 'start': chunk_start, 'end': end, 'page': page
+        })
+    
+    for start, end, ends_paragraph in iter_sentences(text):
+        if len(current) > overlap and end - current[0][0] > CHUNK_SIZE:
+            yield emit()
+            current = carry_overlap(current)
+            overlap = len(current)
+        if current and end - current[0][0] > CHUNK_SIZE:
+            # No room for the overlap next to a long sentence
+            current, overlap = [], 0
+        current.append((start, end))
+        
+        own_size = end - current[overlap][0]
+        if own_size >= CHUNK_MIN_SIZE and (ends_paragraph or zlib.crc32(text[start:end].encode('utf-8')) % 4 == 0):
+            yield emit()
+            current = carry_overlap(current)
+            overlap = len(current)
+    
+    if len(current) > overlap:
+        yield emit()
+
+def carry_overlap(sentences):
+    """The trailing sentences, at most CHUNK_OVERLAP characters, that start the next chunk"""
+    carried = []
+    for start, end in reversed(sentences):
+        if sentences[-1][1] - start > CHUNK_OVERLAP:
+            break
+        carried.insert(0, (start, end))
+    return carried
+
+class VectorStoreCache:
+    """Content-addressed FAISS index store with an in-memory LRU in front of disk.
+
+    Indexes are saved with save_local under INDEX_CACHE_DIR, one directory
+    per content hash, and expire after INDEX_CACHE_TTL_SECONDS or when the
+    directory grows past INDEX_CACHE_MAX_BYTES (oldest use first). Recently
+    used indexes stay loaded in this worker up to INDEX_MEMORY_MAX_BYTES.
+    
+    When a document ID is given, the key of its latest index is recorded,
+    and a new version of the document is built from that index: chunks it
+    already holds keep their vectors and only new chunks are embedded.
+    """
+    
+    def __init__(self, cache_dir, max_bytes, ttl_seconds, memory_max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.memory_max_bytes = memory_max_bytes
+        self.lock = threading.Lock()
+        self.hot = OrderedDict()
+        self.hot_bytes = 0
+        self.counters = {'memoryHits': 0, 'diskHits': 0, 'misses': 0, 'reusedChunks': 0, 'embeddedChunks': 0}
+        self.versions = {}
+        self.dir_checked = None
+    
+    def get_or_build(self, text, document_id=None, page_offsets=None):
+        """Return the vector store for text, building and persisting it on a miss"""
+        key = self.key(text, page_offsets)
+        
+        with self.lock:
+            if key in self.hot:
+                self.hot.move_to_end(key)
+                self.counters['memoryHits'] += 1
+                CACHE_REQUESTS.labels('index', 'memory_hit').inc()
+                vectorstore = self.hot[key][0]
+            else:
+                vectorstore = None
+        
+        if vectorstore is None:
+            vectorstore = self._load(key)
+            if vectorstore is not None:
+                self._count('diskHits')
+            else:
+                self._count('misses')
+                previous = self._latest_version(document_id) if document_id else None
+                vectorstore = self._build(text, page_offsets, previous)
+                self._save(key, vectorstore)
+            self._remember(key, vectorstore)
+        
+        if document_id:
+            self._record_version(document_id, key)
+        return vectorstore
+    
+    def key(self, text, page_offsets=None):
+        digest = hashlib.sha256()
+        digest.update(f"{EMBEDDING_ID}:sentences:{CHUNK_MIN_SIZE}-{CHUNK_SIZE}:{CHUNK_OVERLAP}:".encode('utf-8'))
+        if page_offsets:
+            digest.update(f"{','.join(str(offset) for offset in page_offsets)}:".encode('utf-8'))
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def stats(self):
+        """Return hit counters and memory/disk usage"""
+        entries = self._entries()
+        with self.lock:
+            return {
+                **self.counters,
+                'loaded': len(self.hot),
+                'memoryBytes': self.hot_bytes,
+                'memoryMaxBytes': self.memory_max_bytes,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'maxBytes': self.max_bytes
+            }
+    
+    def _build(self, text, page_offsets, previous):
+        from langchain_community.vectorstores import FAISS
+        
+        # Repeated chunks (headers, boilerplate, pasted notes) are embedded once
+        with timed('split'):
+            chunks = list({chunk.metadata['id']: chunk for chunk in iter_chunks(text, page_offsets)}.values())
+        
+        # Chunks the previous version of the document already has keep their vectors
+        vectors = {}
+        if previous is not None:
+            positions = {doc_id: position for position, doc_id in previous.index_to_docstore_id.items()}
+            for chunk in chunks:
+                position = positions.get(chunk.metadata['id'])
+                if position is not None:
+                    vectors[chunk.metadata['id']] = previous.index.reconstruct(position)
+        missing = [chunk for chunk in chunks if chunk.metadata['id'] not in vectors]
+        if missing:
+            vectors.update(zip(
+                (chunk.metadata['id'] for chunk in missing),
+                embeddings.embed_documents([chunk.page_content for chunk in missing])
+            ))
+        with self.lock:
+            self.counters['reusedChunks'] += len(chunks) - len(missing)
+            self.counters['embeddedChunks'] += len(missing)
+        
+        with timed('index_build'):
+            return FAISS.from_embeddings(
+                [(chunk.page_content, vectors[chunk.metadata['id']]) for chunk in chunks],
+                embeddings,
+                metadatas=[chunk.metadata for chunk in chunks],
+                ids=[chunk.metadata['id'] for chunk in chunks]
+            )
+    
+    def _latest_version(self, document_id):
+        """Return the last index built for document_id while it is still loaded or saved"""
+        key = self.versions.get(document_id)
+        if key is None and self.max_bytes > 0:
+            try:
+                with open(self._version_path(document_id)) as version_file:
+                    key = version_file.read().strip()
+            except OSError:
+                return None
+        if not key:
+            return None
+        
+        with self.lock:
+            if key in self.hot:
+                return self.hot[key][0]
+        return self._load(key)
+    
+    def _record_version(self, document_id, key):
+        if self.versions.get(document_id) == key:
+            return
+        self.versions[document_id] = key
+        if self.max_bytes <= 0:
+            return
+        try:
+            # Shared through the index directory so every worker finds the latest version
+            path = self._version_path(document_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as version_file:
+                version_file.write(key)
+            os.replace(temp_path, path)
+        except OSError as e:
+            log_error('index_save', f"Index version write error: {str(e)}")
+    
+    def _version_path(self, document_id):
+        name = hashlib.sha256(str(document_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, '.documents', name)
+    
+    def _private_dir(self):
+        """Create the cache directory as 0700 and check that only this user can write to it.
+
+        Indexes are unpickled on load, so a directory someone else created or
+        can write to (the default lives under the shared temp directory)
+        would let them run code in the service; the cache is disabled instead.
+        """
+        if self.dir_checked is None:
+            try:
+                os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+                info = os.lstat(self.cache_dir)
+                if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+                    raise PermissionError(f"{self.cache_dir} is not a directory owned by this user")
+                if info.st_mode & 0o077:
+                    os.chmod(self.cache_dir, 0o700)
+                self.dir_checked = True
+            except OSError as e:
+                log_error('index_load', f"Index cache disabled: {str(e)}")
+                self.dir_checked = False
+        return self.dir_checked
+    
+    def _load(self, key):
+        path = os.path.join(self.cache_dir, key)
+        if self.max_bytes <= 0 or not self._private_dir() or not os.path.isdir(path):
+            return None
+        try:
+            from langchain_community.vectorstores import FAISS
+            with timed('index_load'):
+                vectorstore = FAISS.load_local(path, embeddings)
+            os.utime(path)  # Mark as most recently used
+            return vectorstore
+        except Exception as e:
+            log_error('index_load', f"Index cache load error: {str(e)}")
+            return None
+    
+    def _save(self, key, vectorstore):
+        if self.max_bytes <= 0 or not self._private_dir():
+            return
+        try:
+            # Save beside the final path and rename so readers never see a partial index
+            temp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+            vectorstore.save_local(temp_path)
+            try:
+                os.rename(temp_path, os.path.join(self.cache_dir, key))
+            except OSError:
+                # Another worker stored the same content first
+                shutil.rmtree(temp_path, ignore_errors=True)
+            self._evict()
+        except Exception as e:
+            log_error('index_save', f"Index cache save error: {str(e)}")
+    
+    def _remember(self, key, vectorstore):
+        # Vectors dominate; texts are counted at one byte per character
+        index = vectorstore.index
+        size = index.ntotal * index.d * 4
+        size += sum(len(doc.page_content) for doc in vectorstore.docstore._dict.values())
+        
+        with self.lock:
+            if key in self.hot:
+                return
+            self.hot[key] = (vectorstore, size)
+            self.hot_bytes += size
+            while self.hot_bytes > self.memory_max_bytes and len(self.hot) > 1:
+                _, (_, evicted_size) = self.hot.popitem(last=False)
+                self.hot_bytes -= evicted_size
+    
+    def _count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+        CACHE_REQUESTS.labels('index', 'disk_hit' if counter == 'diskHits' else 'miss').inc()
+    
+    def _entries(self):
+        entries = []
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if not entry.is_dir() or entry.name.startswith('.'):
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except OSError:
+                    continue
+        except OSError:
+            pass
+        return entries
+    
+    def _evict(self):
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        expires_before = time.time() - self.ttl_seconds
+        for mtime, size, path in entries:
+            if mtime >= expires_before and total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_bytes -= size
+        try:
+            for entry in os.scandir(os.path.join(self.cache_dir, '.documents')):
+                if entry.stat().st_mtime < expires_before:
+                    os.remove(entry.path)
+        except OSError:
+            pass
+
+vector_store_cache = VectorStoreCache(
+    INDEX_CACHE_DIR, INDEX_CACHE_MAX_BYTES, INDEX_CACHE_TTL_SECONDS, INDEX_MEMORY_MAX_BYTES
+)
+
+def create_vector_store(text, document_id=None, page_offsets=None):
+    """Create FAISS vector store from text, reusing a stored index for identical content.
+
+    document_id names the note the text came from, so an edited note only
+    re-embeds its changed chunks; page_offsets (from /extract) tag chunks
+    with their page.
+    """
+    return vector_store_cache.get_or_build(text, document_id, page_offsets)
+
+def estimate_tokens(text):
+    """Rough token count used for context budgets, about four characters per token"""
+    return -(-len(text) // 4)
+
+def context_budget(items):
+    """Token budget for the context of one completion covering items questions or days"""
+    return min(CONTEXT_MAX_TOKENS, CONTEXT_BASE_TOKENS + CONTEXT_TOKENS_PER_ITEM * items)
+
+def trim_overlap(text, packed_texts, min_overlap=32):
+    """Cut the parts of text that repeat the splitter overlap with chunks already packed"""
+    for other in packed_texts:
+        if text in other:
+            return ''
+        for size in range(min(CHUNK_OVERLAP, len(text), len(other)), min_overlap - 1, -1):
+            if other.endswith(text[:size]):
+                text = text[size:].lstrip()
+                break
+        for size in range(min(CHUNK_OVERLAP, len(text), len(other)), min_overlap - 1, -1):
+            if other.startswith(text[-size:]):
+                text = text[:-size].rstrip()
+                break
+    return text
+
+def retrieve(vectorstore, query, token_budget):
+    """Return chunks relevant to query that fit in token_budget.
+
+    Candidates come from an MMR search so the context spreads over the
+    document rather than repeating its closest passage, and overlap shared
+    with chunks already packed is trimmed before counting tokens.
+    """
+    with timed('retrieval'):
+        total = vectorstore.index.ntotal
+        if total == 0:
+            return []
+        # Enough candidates to fill the budget even after overlaps are trimmed
+        k = min(total, -(-token_budget // estimate_tokens('x' * (CHUNK_SIZE - CHUNK_OVERLAP))) + 1)
+        candidates = vectorstore.max_marginal_relevance_search(
+            query, k=k, fetch_k=min(total, max(4 * k, 20)), lambda_mult=MMR_LAMBDA
+        )
+        
+        docs = []
+        packed_texts = []
+        used = 0
+        for doc in candidates:
+            text = trim_overlap(doc.page_content, packed_texts)
+            tokens = estimate_tokens(text)
+            if not text or (docs and used + tokens > token_budget):
+                continue
+            docs.append(Document(page_content=text, metadata=doc.metadata))
+            packed_texts.append(doc.page_content)
+            used += tokens
+        return docs
+
+QUIZ_PROMPT_TEMPLATE = """You are an expert quiz generator. Based on the following content, generate quiz questions.
 
 Content: {context}
 
@@ -138,113 +1152,312 @@ Rules:
 
 Question: {question}"""
 
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=["context", "question"]
-        )
+def extract_json_object(result_text):
+    """Parse the outermost JSON object in an LLM response, or return None"""
+    try:
+        start_idx = result_text.find('{')
+        end_idx = result_text.rfind('}') + 1
+        if start_idx != -1 and end_idx > start_idx:
+            return json.loads(result_text[start_idx:end_idx])
+    except json.JSONDecodeError:
+        pass
+    return None
+
+class JSONItemScanner:
+    """Incrementally picks complete objects out of a JSON array as text arrives.
+
+    Text is fed in arbitrary pieces; each call returns the objects of the
+    array stored under array_key (e.g. "questions") whose closing brace has
+    been seen since the last call. Objects that fail to parse are skipped
+    rather than discarding the rest, and everything completed before a
+    truncation is kept.
+    """
+    
+    def __init__(self, array_key):
+        self.array_key = array_key
+        self.text = ''
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.string_start = 0
+        self.last_string = None
+        self.key = None
+        self.item_start = None
+        self.item_depth = 0
+    
+    def feed(self, text):
+        self.text += text
+        items = []
+        for index in range(self.pos, len(self.text)):
+            char = self.text[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = self.text[self.string_start + 1:index]
+            elif char == '"':
+                self.in_string = True
+                self.string_start = index
+            elif char == ':':
+                self.key = self.last_string
+            elif char == ',':
+                self.key = None
+            elif char in '{[':
+                if (char == '{' and self.item_start is None and self.stack
+                        and self.stack[-1] == ('[', self.array_key)):
+                    self.item_start = index
+                    self.item_depth = len(self.stack)
+                self.stack.append((char, self.key))
+                self.key = None
+            elif char in '}]' and self.stack:
+                self.stack.pop()
+                if self.item_start is not None and len(self.stack) == self.item_depth:
+                    try:
+                        item = json.loads(self.text[self.item_start:index + 1])
+                        if isinstance(item, dict):
+                            items.append(item)
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+        self.pos = len(self.text)
+        return items
+
+def salvage_json_items(result_text, array_key):
+    """Return every complete object in the array under array_key, even from malformed output"""
+    return JSONItemScanner(array_key).feed(result_text)
+
+def iter_stream_items(sink, tags, array_key):
+    """Yield (tag, item) for each object completed in the streams feeding sink.
+
+    Each stream yields (tag, None) once when it ends or fails.
+    """
+    scanners = {tag: JSONItemScanner(array_key) for tag in tags}
+    remaining = set(scanners)
+    while remaining:
+        tag, delta = sink.get()
+        if delta is None or isinstance(delta, Exception):
+            if delta is not None:
+                log_error('llm', f"LLM stream error: {str(delta)}")
+            remaining.discard(tag)
+            yield tag, None
+            continue
+        for item in scanners[tag].feed(delta):
+            yield tag, item
+
+def question_key(question):
+    """Normalised question text, used to drop duplicates across batches"""
+    return " ".join(str(question.get('question', '')).lower().split())
+
+def generate_quiz_questions(content, topic, question_count, difficulty, question_types, document_id=None, page_offsets=None, use_cache=True):
+    """Generate quiz questions using RAG; use_cache=False bypasses the LLM response cache"""
+    try:
+        # Create vector store
+        vectorstore = create_vector_store(content, document_id, page_offsets)
         
-        # Create retrieval chain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-            chain_type_kwargs={"prompt": prompt}
-        )
+        # Large quizzes are split into smaller batches generated concurrently
+        if QUIZ_BATCH_SIZE > 0 and question_count > QUIZ_BATCH_SIZE:
+            return generate_quiz_questions_sharded(
+                vectorstore, topic, question_count, difficulty, question_types, use_cache
+            )
+        
+        # Build question types string
+        types_str = ", ".join(question_types)
         
         # Generate questions with all details in the query
         query = f"Generate {question_count} {difficulty} difficulty quiz questions about {topic}. Question types: {types_str}"
         
-        result = qa_chain.invoke({"query": query})
+        docs = retrieve(vectorstore, query, context_budget(question_count))
+        result_text = submit_completion(QUIZ_PROMPT_TEMPLATE, docs, query, use_cache).result()
         
         # Parse result
-        result_text = result.get('result', '')
+        quiz_data = extract_json_object(result_text)
+        if quiz_data is not None:
+            return quiz_data
         
-        # Try to extract JSON from the result
-        try:
-            # Find JSON in the response
-            start_idx = result_text.find('{')
-            end_idx = result_text.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = result_text[start_idx:end_idx]
-                quiz_data = json.loads(json_str)
-                return quiz_data
-        except json.JSONDecodeError:
-            pass
+        # Keep the questions that were complete before the output broke off
+        questions = salvage_json_items(result_text, 'questions')
+        if questions:
+            return {"questions": questions}
         
         # If parsing fails, generate a fallback response
         return generate_fallback_questions(topic, question_count, difficulty, question_types)
         
     except Exception as e:
-        print(f"Quiz generation error: {str(e)}")
+        log_error('quiz', f"Quiz generation error: {str(e)}")
         return generate_fallback_questions(topic, question_count, difficulty, question_types)
 
-def generate_fallback_questions(topic, question_count, difficulty, question_types):
-    """Generate fallback questions when RAG fails"""
-    questions = []
+def generate_quiz_questions_sharded(vectorstore, topic, question_count, difficulty, question_types, use_cache=True):
+    """Generate a large quiz as several smaller batches, each over its own retrieved context"""
+    types_str = ", ".join(question_types)
+    shard_count = -(-question_count // QUIZ_BATCH_SIZE)
     
-    for i in range(question_count):
-        q_type = question_types[i % len(question_types)]
-        
-        if q_type == 'mcq':
-            questions.append({
-                "question": f"Question {i+1} about {topic}?",
-                "type": "mcq",
-                "options": ["Option A", "Option B", "Option C", "Option D"],
-                "correctAnswer": "Option A"
-            })
-        elif q_type == 'true-false':
-            questions.append({
-                "question": f"Statement {i+1} about {topic} is correct.",
-                "type": "true-false",
-                "options": ["True", "False"],
-                "correctAnswer": "True"
-            })
+    # Retrieve a context budget per shard and deal the chunks out so shards cover different material
+    query = f"Generate {question_count} {difficulty} difficulty quiz questions about {topic}. Question types: {types_str}"
+    docs = retrieve(vectorstore, query, context_budget(QUIZ_BATCH_SIZE) * shard_count)
+    
+    futures = []
+    for shard in range(shard_count):
+        shard_questions = min(QUIZ_BATCH_SIZE, question_count - shard * QUIZ_BATCH_SIZE)
+        shard_docs = docs[shard::shard_count] or docs
+        shard_query = f"Generate {shard_questions} {difficulty} difficulty quiz questions about {topic}. Question types: {types_str}"
+        futures.append(submit_completion(QUIZ_PROMPT_TEMPLATE, shard_docs, shard_query, use_cache))
+    
+    # Merge the batches, dropping questions another batch already asked
+    questions = []
+    seen = set()
+    for future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            log_error('llm', f"Quiz batch error: {str(e)}")
+            continue
+        quiz_data = extract_json_object(result)
+        if isinstance(quiz_data, dict):
+            batch = quiz_data.get('questions', [])
         else:
-            questions.append({
-                "question": f"Explain concept {i+1} related to {topic}.",
-                "type": "short-answer",
-                "correctAnswer": f"Answer related to {topic}"
-            })
+            batch = salvage_json_items(result, 'questions')
+        for question in batch:
+            if not isinstance(question, dict):
+                continue
+            key = question_key(question)
+            if key and key not in seen:
+                seen.add(key)
+                questions.append(question)
+    
+    if not questions:
+        return generate_fallback_questions(topic, question_count, difficulty, question_types)
     
-    return {"questions": questions}
+    # Batches can come back short or repeat each other; pad the shortfall like missing study plan days
+    for index in range(len(questions), question_count):
+        FALLBACKS.labels('quiz_question').inc()
+        questions.append(generate_fallback_question(topic, index, question_types))
+    return {"questions": questions[:question_count]}
 
-def generate_fallback_study_plan(topic, start_date, end_date, days):
-    """Generate a basic fallback study plan"""
-    start = datetime.strptime(start_date, '%Y-%m-%d')
+def iter_quiz_questions(content, topic, question_count, difficulty, question_types, document_id=None, page_offsets=None, use_cache=True):
+    """Yield quiz questions one at a time as the LLM finishes writing each of them.
+
+    Uses the same batches, retrieval and cache keys as generate_quiz_questions,
+    but streams the completions and parses each question object as soon as
+    it closes. Exactly question_count questions are yielded: fallback
+    questions make up any shortfall, or the whole quiz if none could be parsed.
+    """
+    vectorstore = create_vector_store(content, document_id, page_offsets)
+    types_str = ", ".join(question_types)
+    if QUIZ_BATCH_SIZE > 0 and question_count > QUIZ_BATCH_SIZE:
+        shard_count = -(-question_count // QUIZ_BATCH_SIZE)
+    else:
+        shard_count = 1
     
-    daily_schedule = []
-    for i in range(min(days, 14)):  # Cap at 14 days for fallback
-        current_date = start + timedelta(days=i)
-        daily_schedule.append({
-            "day": i + 1,
-            "date": current_date.strftime('%A, %B %d, %Y'),
-            "topics": [f"Topic {i + 1} - {topic}"],
-            "activities": [
-                "Review materials",
-                "Complete practice exercises",
-                "Take notes"
-            ],
-            "duration": "2-3 hours"
-        })
+    query = f"Generate {question_count} {difficulty} difficulty quiz questions about {topic}. Question types: {types_str}"
+    shard_budget = context_budget(QUIZ_BATCH_SIZE if shard_count > 1 else question_count)
+    docs = retrieve(vectorstore, query, shard_budget * shard_count)
+    
+    sink = queue.Queue()
+    futures = []
+    count = 0
+    seen = set()
+    try:
+        for shard in range(shard_count):
+            shard_questions = min(QUIZ_BATCH_SIZE, question_count - shard * QUIZ_BATCH_SIZE) if shard_count > 1 else question_count
+            shard_docs = docs[shard::shard_count] or docs
+            shard_query = f"Generate {shard_questions} {difficulty} difficulty quiz questions about {topic}. Question types: {types_str}"
+            futures.append(stream_completion(QUIZ_PROMPT_TEMPLATE, shard_docs, shard_query, sink, shard, use_cache))
+        
+        for shard, question in iter_stream_items(sink, range(shard_count), 'questions'):
+            if question is None:
+                continue
+            key = question_key(question)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            if count < question_count:
+                count += 1
+                yield question, False
+    except GeneratorExit:
+        # The client went away; stop any completion still generating
+        for future in futures:
+            future.cancel()
+        raise
+    
+    if count == 0:
+        for question in generate_fallback_questions(topic, question_count, difficulty, question_types)['questions']:
+            yield question, True
+        return
+    
+    # Pad a short quiz the same way generate_quiz_questions_sharded does
+    for index in range(count, question_count):
+        FALLBACKS.labels('quiz_question').inc()
+        yield generate_fallback_question(topic, index, question_types), True
+
+def generate_fallback_question(topic, index, question_types):
+    """Generate a generic question for a 0-based quiz position, cycling through question_types"""
+    q_type = question_types[index % len(question_types)]
     
+    if q_type == 'mcq':
+        return {
+            "question": f"Question {index+1} about {topic}?",
+            "type": "mcq",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correctAnswer": "Option A"
+        }
+    elif q_type == 'true-false':
+        return {
+            "question": f"Statement {index+1} about {topic} is correct.",
+            "type": "true-false",
+            "options": ["True", "False"],
+            "correctAnswer": "True"
+        }
+    else:
+        return {
+            "question": f"Explain concept {index+1} related to {topic}.",
+            "type": "short-answer",
+            "correctAnswer": f"Answer related to {topic}"
+        }
+
+def generate_fallback_questions(topic, question_count, difficulty, question_types):
+    """Generate fallback questions when RAG fails"""
+    FALLBACKS.labels('quiz').inc()
+    return {"questions": [generate_fallback_question(topic, i, question_types) for i in range(question_count)]}
+
+def format_plan_date(start, day):
+    """Format the calendar date of a 1-based plan day"""
+    return (start + timedelta(days=day - 1)).strftime('%A, %B %d, %Y')
+
+def generate_fallback_day_plan(start, day, topic):
+    """Generate a generic schedule entry for one plan day"""
     return {
-        "studyPlan": {
-            "overview": f"A {days}-day study plan for {topic}. This plan is structured to help you progressively build your understanding through daily focused study sessions.",
-            "dailySchedule": daily_schedule,
-            "milestones": [
-                f"Complete foundational concepts by day {days // 4}",
-                f"Finish intermediate topics by day {days // 2}",
-                f"Master advanced concepts by day {3 * days // 4}",
-                f"Complete review and practice by day {days}"
-            ],
-            "tips": [
-                "Take regular breaks every 25-30 minutes",
-                "Review previous day's content before starting new topics",
-                "Practice active recall and spaced repetition",
-                "Create your own examples for each concept",
-                "Join study groups or discussion forums"
-            ]
-        },
+        "day": day,
+        "date": format_plan_date(start, day),
+        "topics": [f"Topic {day} - {topic}"],
+        "activities": [
+            "Review materials",
+            "Complete practice exercises",
+            "Take notes"
+        ],
+        "duration": "2-3 hours"
+    }
+
+def generate_fallback_outline(topic, days):
+    """The generic overview, milestones, tips and mindmap used when the LLM gives none"""
+    return {
+        "overview": f"A {days}-day study plan for {topic}. This plan is structured to help you progressively build your understanding through daily focused study sessions.",
+        "milestones": [
+            f"Complete foundational concepts by day {days // 4}",
+            f"Finish intermediate topics by day {days // 2}",
+            f"Master advanced concepts by day {3 * days // 4}",
+            f"Complete review and practice by day {days}"
+        ],
+        "tips": [
+            "Take regular breaks every 25-30 minutes",
+            "Review previous day's content before starting new topics",
+            "Practice active recall and spaced repetition",
+            "Create your own examples for each concept",
+            "Join study groups or discussion forums"
+        ],
         "mindmap": {
             "central": topic,
             "branches": [
@@ -264,25 +1477,222 @@ def generate_fallback_study_plan(topic, start_date, end_date, days):
         }
     }
 
-def generate_study_plan_with_mindmap(notes_content, topic, start_date, end_date):
-    """Generate comprehensive study plan and mindmap using RAG"""
+def generate_fallback_study_plan(topic, start_date, end_date, days):
+    """Generate a basic fallback study plan"""
+    FALLBACKS.labels('study_plan').inc()
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    
+    daily_schedule = []
+    for i in range(min(days, 14)):  # Cap at 14 days for fallback
+        daily_schedule.append(generate_fallback_day_plan(start, i + 1, topic))
+    
+    outline = generate_fallback_outline(topic, days)
+    return {
+        "studyPlan": {
+            "overview": outline['overview'],
+            "dailySchedule": daily_schedule,
+            "milestones": outline['milestones'],
+            "tips": outline['tips']
+        },
+        "mindmap": outline['mindmap']
+    }
+
+STUDY_PLAN_OUTLINE_PROMPT = """You are an expert study planner and educational consultant. Based on the following content, outline a study plan.
+
+Content: {context}
+
+Create the outline in JSON format with the following structure:
+{{
+  "overview": "Brief overview of the study plan (2-3 sentences)",
+  "segments": [
+    {{
+      "segment": 1,
+      "focus": ["topic1", "topic2", "topic3"]
+    }}
+  ],
+  "milestones": ["milestone1", "milestone2", "milestone3"],
+  "tips": ["tip1", "tip2", "tip3", "tip4"],
+  "mindmap": {{
+    "central": "Main topic",
+    "branches": [
+      {{
+        "name": "Branch 1",
+        "subbranches": ["sub1", "sub2", "sub3"]
+      }}
+    ]
+  }}
+}}
+
+Requirements:
+1. Split the material across the segments with proper progression, one entry per segment
+2. Base the outline on the actual content provided
+3. Provide 4-5 key milestones
+4. Give 4-6 practical study tips
+5. Create a mindmap with 3-5 main branches, each with 3-5 subbranches
+6. Return ONLY valid JSON, no other text
+7. Extract all formulas/equations from the content and include them as a dedicated branch in the mindmap under "Formulas".
+
+Question: {question}"""
+
+STUDY_PLAN_SEGMENT_PROMPT = """You are an expert study planner and educational consultant. Based on the following content, create the daily schedule for one part of a study plan.
+
+Content: {context}
+
+Create the schedule in JSON format with the following structure:
+{{
+  "dailySchedule": [
+    {{
+      "day": 1,
+      "topics": ["topic1", "topic2"],
+      "activities": ["activity1", "activity2"],
+      "duration": "2-3 hours"
+    }}
+  ]
+}}
+
+Requirements:
+1. Include exactly one entry per requested day, numbered as requested
+2. Base the schedule on the actual content provided
+3. Include specific topics, activities, and time estimates
+4. Return ONLY valid JSON, no other text
+
+Question: {question}"""
+
+def combine_notes(notes_content):
+    """Combine the selected notes into one document for indexing"""
+    return "\n\n".join([
+        f"Note: {note['name']}\n{note['content']}"
+        for note in notes_content
+    ])
+
+def split_plan_segments(days):
+    """Split a plan into (first_day, last_day) segments of STUDY_PLAN_SEGMENT_DAYS days"""
+    segment_days = max(STUDY_PLAN_SEGMENT_DAYS, 1)
+    return [
+        (first_day, min(first_day + segment_days - 1, days))
+        for first_day in range(1, days + 1, segment_days)
+    ]
+
+def generate_study_plan_outline(vectorstore, topic, start_date, end_date, days, segment_count, use_cache=True):
+    """Generate the overview, milestones, tips, mindmap and per-segment focus topics"""
+    query = f"Outline a study plan for '{topic}' covering {days} days from {start_date} to {end_date}, split into {segment_count} segments."
+    docs = retrieve(vectorstore, query, context_budget(days))
+    
     try:
-        # Combine all notes content
-        combined_content = "\n\n".join([
-            f"Note: {note['name']}\n{note['content']}" 
-            for note in notes_content
-        ])
-        
-        # Create vector store
-        vectorstore = create_vector_store(combined_content)
-        
-        # Calculate study duration
-        start = datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.strptime(end_date, '%Y-%m-%d')
-        days = (end - start).days + 1
+        outline = extract_json_object(submit_completion(STUDY_PLAN_OUTLINE_PROMPT, docs, query, use_cache).result())
+    except Exception as e:
+        log_error('study_plan', f"Study plan outline error: {str(e)}")
+        outline = None
+    
+    if not isinstance(outline, dict):
+        FALLBACKS.labels('study_plan_outline').inc()
+        outline = {}
+    fallback = generate_fallback_outline(topic, days)
+    
+    focus = [
+        segment.get('focus') if isinstance(segment, dict) else None
+        for segment in outline.get('segments') or []
+    ]
+    return {
+        "overview": outline.get('overview') or fallback['overview'],
+        "milestones": outline.get('milestones') or fallback['milestones'],
+        "tips": outline.get('tips') or fallback['tips'],
+        "mindmap": outline.get('mindmap') or fallback['mindmap'],
+        "focus": [
+            (focus[index] if index < len(focus) and focus[index] else [topic])
+            for index in range(segment_count)
+        ]
+    }
+
+def date_day_plan(day_plan, start, day):
+    day_plan['day'] = day
+    day_plan['date'] = format_plan_date(start, day)
+    return day_plan
+
+def build_segment_schedule(entries, start, first_day, last_day, topic):
+    """Turn a segment's parsed day entries into exactly one dated entry per day, padding gaps"""
+    schedule = []
+    for offset, day in enumerate(range(first_day, last_day + 1)):
+        if offset < len(entries):
+            day_plan = date_day_plan(entries[offset], start, day)
+        else:
+            FALLBACKS.labels('study_plan_day').inc()
+            day_plan = generate_fallback_day_plan(start, day, topic)
+        schedule.append(day_plan)
+    return schedule
+
+def iter_study_plan_segments(notes_content, topic, start_date, end_date, use_cache=True):
+    """Yield the plan outline, then each day and segment as soon as it is generated.
+
+    The outline is generated first so every segment knows its focus topics;
+    segments are then streamed concurrently, each from its own retrieved
+    context. Every day object is yielded as a ('day', data) event as soon
+    as the LLM closes it, and each segment's padded schedule as a
+    ('segment', data) event when its stream ends.
+    """
+    vectorstore = create_vector_store(combine_notes(notes_content))
+    
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    days = (end - start).days + 1
+    segments = split_plan_segments(days)
+    
+    outline = generate_study_plan_outline(vectorstore, topic, start_date, end_date, days, len(segments), use_cache)
+    yield 'outline', {
+        "studyPlan": {
+            "overview": outline['overview'],
+            "milestones": outline['milestones'],
+            "tips": outline['tips']
+        },
+        "mindmap": outline['mindmap'],
+        "days": days,
+        "segments": len(segments)
+    }
+    
+    sink = queue.Queue()
+    futures = []
+    entries = [[] for _ in segments]
+    try:
+        for index, (first_day, last_day) in enumerate(segments):
+            focus = ", ".join(str(item) for item in outline['focus'][index])
+            query = f"Create the daily study schedule for days {first_day} to {last_day} of a {days}-day plan for '{topic}', focusing on: {focus}. Include {last_day - first_day + 1} entries numbered from day {first_day}."
+            docs = retrieve(vectorstore, f"{topic}: {focus}", context_budget(last_day - first_day + 1))
+            futures.append(stream_completion(STUDY_PLAN_SEGMENT_PROMPT, docs, query, sink, index, use_cache))
         
-        # Create prompt template - ONLY use {context} and {question}
-        study_plan_prompt = """You are an expert study planner and educational consultant. Based on the following content, create a detailed study plan.
+        for index, day_plan in iter_stream_items(sink, range(len(segments)), 'dailySchedule'):
+            first_day, last_day = segments[index]
+            if day_plan is None:
+                yield 'segment', {
+                    "segment": index + 1,
+                    "firstDay": first_day,
+                    "lastDay": last_day,
+                    "dailySchedule": build_segment_schedule(entries[index], start, first_day, last_day, topic)
+                }
+            elif first_day + len(entries[index]) <= last_day:
+                date_day_plan(day_plan, start, first_day + len(entries[index]))
+                entries[index].append(day_plan)
+                yield 'day', {"segment": index + 1, "dayPlan": day_plan}
+    except GeneratorExit:
+        for future in futures:
+            future.cancel()
+        raise
+
+def generate_segmented_study_plan(notes_content, topic, start_date, end_date, use_cache=True):
+    """Generate a long study plan from an outline plus concurrently generated segments"""
+    plan_data = None
+    segments = {}
+    for event, data in iter_study_plan_segments(notes_content, topic, start_date, end_date, use_cache):
+        if event == 'outline':
+            plan_data = {"studyPlan": dict(data['studyPlan']), "mindmap": data['mindmap']}
+        elif event == 'segment':
+            segments[data['segment']] = data['dailySchedule']
+    
+    plan_data['studyPlan']['dailySchedule'] = [
+        day_plan for segment in sorted(segments) for day_plan in segments[segment]
+    ]
+    return plan_data
+
+STUDY_PLAN_PROMPT = """You are an expert study planner and educational consultant. Based on the following content, create a detailed study plan.
 
 Content: {context}
 
@@ -325,79 +1735,109 @@ Requirements:
 
 Question: {question}"""
 
-        prompt = PromptTemplate(
-            template=study_plan_prompt,
-            input_variables=["context", "question"]  # ONLY these two
-        )
-   
-        # Create retrieval chain
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 5}),
-            chain_type_kwargs={"prompt": prompt}
-        )
+def generate_study_plan_with_mindmap(notes_content, topic, start_date, end_date, use_cache=True):
+    """Generate comprehensive study plan and mindmap using RAG; use_cache=False bypasses the LLM response cache"""
+    try:
+        # Calculate study duration
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        days = (end - start).days + 1
+        
+        # Long ranges are planned as an outline plus segments generated in parallel
+        if STUDY_PLAN_SEGMENT_DAYS > 0 and days > STUDY_PLAN_SEGMENT_DAYS:
+            return generate_segmented_study_plan(notes_content, topic, start_date, end_date, use_cache)
+        
+        # Combine all notes content and create vector store
+        vectorstore = create_vector_store(combine_notes(notes_content))
         
         # Generate study plan - include all details in the query string
         query = f"Create a comprehensive study plan for '{topic}' covering {days} days from {start_date} to {end_date}. Ensure the daily schedule has {days} entries with proper dates and times."
         
-        result = qa_chain.invoke({"query": query})  # ONLY pass query
-        
-        # Parse result
-        result_text = result.get('result', '')
+        docs = retrieve(vectorstore, query, context_budget(days))
+        result_text = submit_completion(STUDY_PLAN_PROMPT, docs, query, use_cache).result()
         
         # Extract JSON
-        try:
-            start_idx = result_text.find('{')
-            end_idx = result_text.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = result_text[start_idx:end_idx]
-                plan_data = json.loads(json_str)
-                
-                # Add formatted dates to daily schedule
-                current_date = start
-                if 'studyPlan' in plan_data and 'dailySchedule' in plan_data['studyPlan']:
-                    for day_plan in plan_data['studyPlan']['dailySchedule']:
-                        day_plan['date'] = current_date.strftime('%A, %B %d, %Y')
-                        current_date += timedelta(days=1)
-                
-                return plan_data
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            pass
+        plan_data = extract_json_object(result_text)
+        if plan_data is not None:
+            # Add formatted dates to daily schedule
+            current_date = start
+            if 'studyPlan' in plan_data and 'dailySchedule' in plan_data['studyPlan']:
+                for day_plan in plan_data['studyPlan']['dailySchedule']:
+                    day_plan['date'] = current_date.strftime('%A, %B %d, %Y')
+                    current_date += timedelta(days=1)
+            
+            return plan_data
+        
+        log_error('study_plan', "JSON parsing error: no valid study plan in the response")
         
         # Fallback
         return generate_fallback_study_plan(topic, start_date, end_date, days)
         
     except Exception as e:
-        print(f"Study plan generation error: {str(e)}")
+        log_error('study_plan', f"Study plan generation error: {str(e)}")
         return generate_fallback_study_plan(topic, start_date, end_date, days)
 
+job_queue = JobQueue(JOB_DB_PATH)
+
+# /metrics and request timing (SERVER_TIMING, PROMETHEUS_MULTIPROC_DIR), /extract* and /jobs/<id>
+app.register_blueprint(make_metrics_blueprint())
+app.register_blueprint(make_extract_blueprint(extractor, job_queue))
+app.register_blueprint(make_jobs_blueprint(job_queue))
+
+@app.before_request
+def ensure_models_loading():
+    if not _models_ready.is_set():
+        start_background_loading()
+
+def wants_llm_cache():
+    """False when the client opted out of the LLM response cache ("cache": false or Cache-Control: no-cache)"""
+    data = request.get_json(silent=True) if request.is_json else None
+    body_opt_out = isinstance(data, dict) and data.get('cache') is False
+    header_opt_out = 'no-cache' in request.headers.get('Cache-Control', '')
+    return not (body_opt_out or header_opt_out)
+
+@app.after_request
+def add_llm_cache_headers(response):
+    stats = g.get('llm_cache')
+    if stats is None:
+        return response
+    if not llm_cache.enabled or not wants_llm_cache():
+        response.headers['X-LLM-Cache'] = 'bypass'
+    elif stats['misses'] == 0:
+        response.headers['X-LLM-Cache'] = 'hit'
+    elif stats['hits'] == 0:
+        response.headers['X-LLM-Cache'] = 'miss'
+    else:
+        response.headers['X-LLM-Cache'] = 'partial'
+    response.headers['X-LLM-Cache-Hits'] = str(stats['hits'])
+    response.headers['X-LLM-Cache-Latency-Ms'] = f"{stats['hitLatencyMs']:.2f}"
+    return response
+
+@app.after_request
+def add_llm_token_headers(response):
+    usage = g.get('llm_tokens')
+    if usage is not None:
+        response.headers['X-LLM-Prompt-Tokens'] = str(usage['prompt'])
+        response.headers['X-LLM-Context-Tokens'] = str(usage['context'])
+    return response
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Report whether the models are loaded; /health only reports that the process is up"""
+    if _models_ready.is_set():
+        return jsonify({'status': 'ready', 'startup': startup_report}), 200
+    return jsonify({'status': 'loading', 'startup': startup_report}), 503
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy'}), 200
+    return jsonify({
+        'status': 'healthy',
+        'cache': extractor.cache.stats(),
+        'indexCache': vector_store_cache.stats(),
+        'embeddingCache': embeddings.stats(),
+        'jobs': job_queue.stats()
+    }), 200
 
-@app.route('/extract', methods=['POST'])
-def extract_text():
-    try:
-        data = request.json
-        if not data or 'file' not in data or 'mimeType' not in data:
-            return jsonify({'error': 'Missing file or mimeType'}), 400
-        
-        file_data = base64.b64decode(data['file'])
-        mime_type = data['mimeType']
-        
-        if mime_type == 'application/pdf':
-            result = extract_text_from_pdf(file_data)
-        elif mime_type.startswith('image/'):
-            result = extract_text_from_image(file_data)
-        else:
-            return jsonify({'error': 'Unsupported file type'}), 400
-        
-        return jsonify(result), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-       
 @app.route('/generate-quiz', methods=['POST'])
 def generate_quiz():
     try:
@@ -408,20 +1848,70 @@ def generate_quiz():
         question_count = data.get('questionCount', 10)
         difficulty = data.get('difficulty', 'medium')
         question_types = data.get('questionTypes', ['mcq'])
+        document_id = data.get('documentId')
+        page_offsets = data.get('pageOffsets')
+        
+        use_cache = wants_llm_cache()
         
         if not content:
             return jsonify({'error': 'Content is required'}), 400
         
+        if wants_async():
+            return job_accepted(job_queue.submit(
+                'generate-quiz', generate_quiz_questions,
+                content, topic, question_count, difficulty, question_types, document_id, page_offsets, use_cache
+            ))
+        
         quiz_data = generate_quiz_questions(
-            content, topic, question_count, difficulty, question_types
+            content, topic, question_count, difficulty, question_types, document_id, page_offsets, use_cache
         )
         
         return jsonify(quiz_data), 200
         
     except Exception as e:
-        print(f"Error in generate_quiz: {str(e)}")
+        log_error('request', f"Error in generate_quiz: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+    
+@app.route('/generate-quiz/stream', methods=['POST'])
+def generate_quiz_stream():
+    """Stream quiz questions as NDJSON, each one as soon as the LLM has finished writing it"""
+    try:
+        data = request.json
+        
+        content = data.get('content', '')
+        topic = data.get('topic', 'General')
+        question_count = data.get('questionCount', 10)
+        difficulty = data.get('difficulty', 'medium')
+        question_types = data.get('questionTypes', ['mcq'])
+        document_id = data.get('documentId')
+        page_offsets = data.get('pageOffsets')
+        use_cache = wants_llm_cache()
+        
+        if not content:
+            return jsonify({'error': 'Content is required'}), 400
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
     
+    def generate():
+        count = 0
+        fallback_count = 0
+        try:
+            for question, fallback in iter_quiz_questions(
+                content, topic, question_count, difficulty, question_types, document_id, page_offsets, use_cache
+            ):
+                count += 1
+                fallback_count += fallback
+                yield json.dumps({'type': 'question', 'index': count - 1, 'question': question}) + '\n'
+            yield json.dumps({
+                'type': 'done', 'count': count, 'fallback': count > 0 and fallback_count == count,
+                'fallbackCount': fallback_count
+            }) + '\n'
+        except Exception as e:
+            log_error('request', f"Error in generate_quiz_stream: {str(e)}")
+            yield json.dumps({'type': 'error', 'error': str(e), 'count': count}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/generate-study-plan', methods=['POST'])
 def generate_study_plan():
     try:
@@ -431,20 +1921,61 @@ def generate_study_plan():
         start_date = data.get('startDate', '')
         end_date = data.get('endDate', '')
         notes = data.get('notes', [])
+        use_cache = wants_llm_cache()
         
         if not topic or not start_date or not end_date or not notes:
             return jsonify({'error': 'Missing required fields'}), 400
         
+        if wants_async():
+            return job_accepted(job_queue.submit(
+                'generate-study-plan', generate_study_plan_with_mindmap,
+                notes, topic, start_date, end_date, use_cache
+            ))
+        
         # Generate study plan and mindmap
         plan_data = generate_study_plan_with_mindmap(
-            notes, topic, start_date, end_date
+            notes, topic, start_date, end_date, use_cache
         )
         
         return jsonify(plan_data), 200
         
     except Exception as e:
-        print(f"Error in generate_study_plan: {str(e)}")
+        log_error('request', f"Error in generate_study_plan: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/generate-study-plan/stream', methods=['POST'])
+def generate_study_plan_stream():
+    """Stream a study plan as NDJSON: the outline, then each day and segment as it is generated"""
+    try:
+        data = request.json
+        
+        topic = data.get('topic', '')
+        start_date = data.get('startDate', '')
+        end_date = data.get('endDate', '')
+        notes = data.get('notes', [])
+        use_cache = wants_llm_cache()
+        
+        if not topic or not start_date or not end_date or not notes:
+            return jsonify({'error': 'Missing required fields'}), 400
+    except Exception as e:
         return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        try:
+            for event, event_data in iter_study_plan_segments(notes, topic, start_date, end_date, use_cache):
+                yield json.dumps({'type': event, **event_data}) + '\n'
+            yield json.dumps({'type': 'done'}) + '\n'
+        except Exception as e:
+            log_error('request', f"Error in generate_study_plan_stream: {str(e)}")
+            yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+startup_report['importSeconds'] = round(time.perf_counter() - MODULE_STARTED, 2)
+
+# Not in OCR pool processes, which import this module as __mp_main__ when it is run as a script
+if MODEL_LOADING == 'preload' and __name__ != '__mp_main__':
+    load_models()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
@@ -0,0 +1,70 @@
+"""Export the embedding model to ONNX for EMBEDDING_BACKEND=onnx.
+
+Writes model.onnx (float32), model_int8.onnx (weights dynamically quantized
+to int8) and tokenizer.json into the directory of EMBEDDING_ONNX_PATH. Needs
+torch, the model download and `pip install onnx` once; the service then runs
+from the exported files with ONNX Runtime alone.
+
+    cd python-service
+    PYTHONPATH=.. python export_onnx_model.py
+"""
+import argparse
+import inspect
+import os
+
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoModel, AutoTokenizer
+
+from app import EMBEDDING_MODEL, EMBEDDING_ONNX_PATH
+
+class Encoder(torch.nn.Module):
+    """The transformer without pooling, returning its last hidden state"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(
+            input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+        ).last_hidden_state
+
+def export(model_name, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["An example sentence to trace the model with."], return_tensors='pt')
+    inputs = (sample['input_ids'], sample['attention_mask'], sample['token_type_ids'])
+
+    model_path = os.path.join(output_dir, 'model.onnx')
+    names = ['input_ids', 'attention_mask', 'token_type_ids']
+    options = {}
+    # Newer torch defaults to the dynamo exporter; the TorchScript one handles dynamic_axes as given
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        options['dynamo'] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model), inputs, model_path,
+            input_names=names, output_names=['last_hidden_state'],
+            dynamic_axes={name: {0: 'batch', 1: 'tokens'} for name in names + ['last_hidden_state']},
+            opset_version=14, **options
+        )
+
+    quantized_path = os.path.join(output_dir, 'model_int8.onnx')
+    quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QInt8)
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, 'tokenizer.json'))
+    return model_path, quantized_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and quantize it to int8")
+    parser.add_argument('--model', default=EMBEDDING_MODEL, help="model name or local path (default: %(default)s)")
+    parser.add_argument('--output', default=os.path.dirname(EMBEDDING_ONNX_PATH),
+                        help="directory to write to (default: %(default)s)")
+    args = parser.parse_args()
+
+    for path in export(args.model, args.output):
+        print(f"{path}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+if __name__ == '__main__':
+    main()
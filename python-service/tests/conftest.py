@@ -0,0 +1,6 @@
+import os
+import sys
+
+# app.py and the shared extraction package import as they do when the service runs (PYTHONPATH=..)
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [SERVICE_DIR, os.path.dirname(SERVICE_DIR)]
@@ -0,0 +1,38 @@
+import random
+
+from app import CHUNK_SIZE, iter_chunks
+
+WORDS = "cell membrane protein enzyme energy glucose oxygen carbon light reaction nucleus gene force mass wave".split()
+
+
+def notes(paragraphs=12, seed=0):
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + "." for _ in range(6))
+        for _ in range(paragraphs)
+    )
+
+
+def test_chunks_are_deterministic_and_bounded():
+    text = notes()
+    first = list(iter_chunks(text))
+    assert [chunk.metadata for chunk in first] == [chunk.metadata for chunk in iter_chunks(text)]
+    assert all(len(chunk.page_content) <= CHUNK_SIZE for chunk in first)
+    assert all(text[chunk.metadata['start']:chunk.metadata['end']] == chunk.page_content for chunk in first)
+
+
+def test_one_sentence_edit_keeps_other_chunk_ids():
+    text = notes()
+    sentence_start = text.index('. ', len(text) // 2) + 2
+    sentence_end = text.index('.', sentence_start) + 1
+    edited = text[:sentence_start] + "Mitochondria produce most of the energy in a cell." + text[sentence_end:]
+
+    before = list(iter_chunks(text))
+    after_ids = {chunk.metadata['id'] for chunk in iter_chunks(edited)}
+    changed = [chunk for chunk in before if chunk.metadata['id'] not in after_ids]
+    # Chunks before the edit never change; after it the boundaries fall back in step
+    assert changed
+    assert all(chunk.metadata['end'] > sentence_start for chunk in changed)
+    assert before[-1] not in changed
+    assert len(changed) <= len(before) // 3
+
@@ -0,0 +1,31 @@
+import os
+import stat
+
+from app import VectorStoreCache
+
+
+def make_cache(cache_dir):
+    return VectorStoreCache(str(cache_dir), 1024 * 1024, 3600, 0)
+
+
+def test_cache_dir_is_created_private(tmp_path):
+    cache = make_cache(tmp_path / 'indexes')
+    assert cache._private_dir()
+    assert stat.S_IMODE(os.stat(tmp_path / 'indexes').st_mode) == 0o700
+
+
+def test_shared_cache_dir_is_made_private(tmp_path):
+    shared = tmp_path / 'indexes'
+    shared.mkdir()
+    shared.chmod(0o777)
+    assert make_cache(shared)._private_dir()
+    assert stat.S_IMODE(os.stat(shared).st_mode) == 0o700
+
+
+def test_symlinked_cache_dir_disables_the_cache(tmp_path):
+    target = tmp_path / 'elsewhere'
+    target.mkdir()
+    (tmp_path / 'indexes').symlink_to(target)
+    cache = make_cache(tmp_path / 'indexes')
+    assert not cache._private_dir()
+    assert cache._load('0' * 64) is None
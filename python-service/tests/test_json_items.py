@@ -0,0 +1,60 @@
+import json
+
+from app import JSONItemScanner, salvage_json_items
+
+QUESTIONS = [
+    {"question": 'What does "ATP" stand for?', "type": "short-answer", "correctAnswer": "Adenosine triphosphate"},
+    {"question": "Which of {a, b} is a set?", "type": "mcq", "options": ["{a, b}", "[a, b", "}"], "correctAnswer": "{a, b}"},
+    {"question": "A backslash \\ ends this one", "type": "true-false", "options": ["True", "False"], "correctAnswer": "True"}
+]
+
+
+def test_salvage_complete_response():
+    text = "Here is your quiz:\n" + json.dumps({"questions": QUESTIONS}, indent=2) + "\nGood luck!"
+    assert salvage_json_items(text, 'questions') == QUESTIONS
+
+
+def test_escaped_quotes_and_braces_inside_strings():
+    text = json.dumps({"questions": QUESTIONS[:2]})
+    assert '\\"ATP\\"' in text
+    assert salvage_json_items(text, 'questions') == QUESTIONS[:2]
+
+
+def test_truncation_mid_item_keeps_completed_items():
+    text = json.dumps({"questions": QUESTIONS}, indent=2)
+    cut = text.index('"A backslash') + 5
+    assert salvage_json_items(text[:cut], 'questions') == QUESTIONS[:2]
+
+
+def test_truncation_inside_string_with_brace():
+    text = json.dumps({"questions": QUESTIONS})
+    cut = text.index('{a, b}') + 3
+    assert salvage_json_items(text[:cut], 'questions') == QUESTIONS[:1]
+
+
+def test_only_items_of_the_named_array():
+    text = json.dumps({"meta": [{"id": 1}], "questions": QUESTIONS[:1], "extra": {"questions": "not a list"}})
+    assert salvage_json_items(text, 'questions') == QUESTIONS[:1]
+
+
+def test_malformed_item_is_skipped():
+    text = '{"questions": [' + json.dumps(QUESTIONS[0]) + ', {"question": oops}, ' + json.dumps(QUESTIONS[2]) + ']}'
+    assert salvage_json_items(text, 'questions') == [QUESTIONS[0], QUESTIONS[2]]
+
+
+def test_fed_in_pieces():
+    text = json.dumps({"questions": QUESTIONS}, indent=2)
+    scanner = JSONItemScanner('questions')
+    items = []
+    for index in range(0, len(text), 7):
+        items.extend(scanner.feed(text[index:index + 7]))
+    assert items == QUESTIONS
+
+
+def test_each_item_returned_once_when_its_brace_arrives():
+    text = json.dumps({"questions": QUESTIONS[:2]})
+    end_of_first = text.index('}') + 1
+    scanner = JSONItemScanner('questions')
+    assert scanner.feed(text[:end_of_first - 1]) == []
+    assert scanner.feed(text[end_of_first - 1:end_of_first]) == QUESTIONS[:1]
+    assert scanner.feed(text[end_of_first:]) == QUESTIONS[1:2]
@@ -0,0 +1,68 @@
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from extraction import ExtractionConfig
+from extraction.imaging import PageSkipped, analyze_page_image, image_frame_count, ocr_image_frame
+
+# A letter-size page at 96 DPI, the resolution pages are probed at
+SIZE = (816, 1056)
+CONFIG = ExtractionConfig()
+
+
+def speckle(img, specks=((100, 200), (400, 700), (650, 900))):
+    draw = ImageDraw.Draw(img)
+    for x, y in specks:
+        draw.rectangle((x, y, x + 3, y + 3), fill=40)
+    return img
+
+
+def noisy_page(level=245, sigma=5, seed=0):
+    rng = random.Random(seed)
+    pixels = bytes(max(0, min(255, round(rng.gauss(level, sigma)))) for _ in range(SIZE[0] * SIZE[1]))
+    return Image.frombytes('L', SIZE, pixels)
+
+
+def text_page(ink, paper):
+    img = Image.new('L', SIZE, paper)
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default(size=13)
+    for y in range(80, SIZE[1] - 80, 20):
+        draw.text((60, y), "Photosynthesis converts light energy into chemical energy in glucose", fill=ink, font=font)
+    return img
+
+
+def test_white_page_is_blank():
+    assert analyze_page_image(Image.new('L', SIZE, 255), CONFIG) == (True, None)
+
+
+def test_speckled_page_is_blank():
+    assert analyze_page_image(speckle(Image.new('L', SIZE, 255)), CONFIG) == (True, None)
+
+
+def test_noisy_speckled_page_is_blank():
+    assert analyze_page_image(speckle(noisy_page()), CONFIG) == (True, None)
+
+
+def test_faint_text_is_read():
+    blank, line_height = analyze_page_image(text_page(ink=190, paper=220), CONFIG)
+    assert not blank
+    assert line_height is not None
+
+
+def test_dark_text_is_read():
+    blank, line_height = analyze_page_image(text_page(ink=20, paper=250), CONFIG)
+    assert not blank
+    assert 8 <= line_height <= 20
+
+
+def test_decompression_bomb_is_skipped_as_too_large(monkeypatch):
+    buffer = io.BytesIO()
+    Image.new('L', (400, 300), 255).save(buffer, 'PNG')
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 50_000)
+    assert image_frame_count(buffer.getvalue()) == 1
+    with pytest.raises(PageSkipped) as skipped:
+        ocr_image_frame(buffer.getvalue(), 0, CONFIG)
+    assert skipped.value.reason == 'too_large'